@@ -2,14 +2,24 @@
 Get data from the behavior master table and give suggestions
 """
 # %%
+import re
 import logging
+import datetime
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 
 from aind_auto_train.schema.curriculum import TrainingStage
 from aind_auto_train.schema.task import metrics_class, Metrics, DynamicForagingMetrics
-from aind_auto_train.util.aws_util import import_df_from_s3, export_df_to_s3
-from aind_auto_train.plot.manager import plot_manager_all_progress
+from aind_auto_train.util.aws_util import (import_df_from_s3, export_df_to_s3, glob_s3,
+                                          import_partitioned_df_from_s3, export_json_to_s3,
+                                          delete_files_on_s3)
+from aind_auto_train.util.manager_util import (RowBuffer, SessionIndex, SubjectState, MetricsHistory,
+                                               build_subject_states, subject_states_from_df,
+                                               subject_states_to_df, metrics_history_to_df,
+                                               metrics_history_from_df, record_metrics_history,
+                                               expand_metrics_column)
 from aind_auto_train.curriculum_manager import CurriculumManager
 
 logger = logging.getLogger(__name__)
@@ -33,6 +43,10 @@ class AutoTrainManager:
     # Specify the Metrics subclass for a specific task
     _metrics_model: metrics_class
 
+    # If True, the `metrics` of each df_manager row only store the length of the history
+    # (see get_full_metrics() to rebuild the full metrics)
+    if_compact_metrics: bool = False
+
     def __init__(self,
                  manager_name: str,
                  if_rerun_all: bool = False,
@@ -42,11 +56,17 @@ class AutoTrainManager:
             Name of the manager, will be used for dababase
         """
         self.manager_name = manager_name
+        self._df_manager_buffer = RowBuffer()  # New rows not yet materialised in df_manager
+        self._behavior_index = SessionIndex()
+        self._manager_index = SessionIndex()  # Also covers the buffered rows
+        self._subject_states = None  # {subject_id: SubjectState}, rebuilt lazily if None
+        self._metrics_histories = None  # {subject_id: history in arrival order} for compact metrics
         self.df_behavior, self.df_manager = self.download_from_database()
 
         # Check if all required metrics exist in df_behavior
-        self.task_specific_metrics_keys = set(self._metrics_model.model_json_schema()['properties'].keys()) \
-            - set(Metrics.model_json_schema()['properties'].keys())
+        # (A list in the order of the model fields, so that the column order is the same in worker processes)
+        self.task_specific_metrics_keys = [key for key in self._metrics_model.model_json_schema()['properties']
+                                           if key not in Metrics.model_json_schema()['properties']]
         assert all([col in self.df_behavior.columns for col in
                     list(self.task_specific_metrics_keys)]), "Not all required metrics exist in df_behavior!"
 
@@ -73,10 +93,108 @@ class AutoTrainManager:
                                                     'if_closed_loop', 'if_overriden_by_trainer',
                                                     'decision', 'next_stage_suggested'])
 
+        # Restore the per-subject training states saved next to df_manager
+        if not if_rerun_all:
+            self._load_subject_states(self.download_subject_states_from_database())
+            # Restore the metrics histories the compact metrics refer to
+            if self.if_compact_metrics:
+                self._metrics_histories = metrics_history_from_df(
+                    self.download_metrics_history_from_database())
+
         # Initialize CurriculumManager
         # Use default s3 path to saved_curriculums
         self.curriculum_manager = CurriculumManager()
 
+    @property
+    def df_behavior(self) -> pd.DataFrame:
+        return self._df_behavior
+
+    @df_behavior.setter
+    def df_behavior(self, df: pd.DataFrame):
+        self._df_behavior = df
+        self._behavior_index.update(df)
+
+    @property
+    def df_manager(self) -> pd.DataFrame:
+        """ The manager table, including rows buffered since the last read """
+        self._materialize_df_manager()
+        return self._df_manager
+
+    @df_manager.setter
+    def df_manager(self, df: pd.DataFrame):
+        # Replacing the table drops any buffered rows
+        self._df_manager = df
+        self._df_manager_buffer.clear()
+        self._manager_index.update(df)
+        self._subject_states = None
+
+    def _materialize_df_manager(self):
+        """ Move all buffered rows into df_manager with a single pd.concat """
+        if len(self._df_manager_buffer):
+            self._df_manager = pd.concat(
+                [self._df_manager, self._df_manager_buffer.to_frame()], ignore_index=True)
+            self._df_manager_buffer.clear()
+
+    def _append_to_df_manager(self, rows: list):
+        """ Buffer new rows of df_manager (materialised when df_manager is read) """
+        self._df_manager_buffer.extend(rows)
+        for row in rows:
+            self._manager_index.append(row['subject_id'], row['session'])
+
+    def _get_manager_history(self, subject_id) -> list:
+        """ Rows of this subject in df_manager (including buffered rows), without materialising """
+        n_materialised = len(self._df_manager)
+        positions = self._manager_index.rows(subject_id)
+        history = self._df_manager.iloc[
+            [i for i in positions if i < n_materialised]
+        ][['session', 'current_stage_actual', 'next_stage_suggested']].to_dict(orient='records')
+        return history + [self._df_manager_buffer.row(i - n_materialised)
+                          for i in positions if i >= n_materialised]
+
+    def _load_subject_states(self, df_states: pd.DataFrame):
+        """ Use the saved subject states if they are consistent with df_manager """
+        if df_states is None or not len(df_states):
+            return
+        if (df_states['n_rows'].sum() != len(self._df_manager)
+                or set(df_states['subject_id']) != set(self._df_manager['subject_id'])):
+            logger.warning('Saved subject states do not match df_manager, will rebuild them.')
+            return
+        self._subject_states = subject_states_from_df(df_states)
+
+    def _get_subject_states(self) -> dict:
+        """ {subject_id: SubjectState} of all subjects in df_manager (including buffered rows) """
+        if self._subject_states is None:
+            self._subject_states = build_subject_states(self.df_manager)
+        return self._subject_states
+
+    @property
+    def df_subject_states(self) -> pd.DataFrame:
+        """ The per-subject training states as a table (saved next to df_manager) """
+        return subject_states_to_df(self._get_subject_states())
+
+    def _get_metrics_histories(self) -> dict:
+        """ {subject_id: metrics history recorded at evaluation time, in the order sessions arrived} """
+        if self._metrics_histories is None:
+            self._metrics_histories = {}
+        return self._metrics_histories
+
+    @property
+    def df_metrics_history(self) -> pd.DataFrame:
+        """ The metrics history of each subject as recorded when its sessions were evaluated
+        (one row per subject), which the compact metrics of df_manager refer to
+        """
+        return metrics_history_to_df(self._get_metrics_histories())
+
+    def get_full_metrics(self) -> pd.Series:
+        """ The full metrics of each row of df_manager, even if stored compact
+        Usage: df_manager['metrics'] = manager.get_full_metrics()
+        """
+        return expand_metrics_column(self.df_manager, self.df_metrics_history)
+
+    def _get_behavior_this(self, subject_id) -> pd.DataFrame:
+        """ All sessions of this subject in df_behavior """
+        return self.df_behavior.iloc[self._behavior_index.rows(subject_id)]
+
     def download_from_database(self) -> (pd.DataFrame, pd.DataFrame):
         """The user must override this method! 
         This function must return two dataframes, df_behavior and df_manager
@@ -84,6 +202,18 @@ class AutoTrainManager:
         raise Exception(
             'download_from_database() of AutoTrainManager must be overridden!')
 
+    def download_subject_states_from_database(self) -> pd.DataFrame:
+        """Override this method to restore df_subject_states saved by upload_to_database().
+        If None is returned, the states are rebuilt from df_manager.
+        """
+        return None
+
+    def download_metrics_history_from_database(self) -> pd.DataFrame:
+        """Override this method to restore df_metrics_history saved by upload_to_database()
+        (only used with compact metrics).
+        """
+        return None
+
     def upload_to_database(self):
         """The user must override this method!
         This function must somehow upload df_manager to the database
@@ -93,18 +223,10 @@ class AutoTrainManager:
             'upload_to_database() of AutoTrainManager must be overridden!')
 
     def _count_session_at_current_stage(self,
-                                        df: pd.DataFrame,
-                                        subject_id: str,
+                                        state: SubjectState,
                                         current_stage: str) -> int:
         """ Count the number of sessions at the current stage (reset after rolling back) """
-        session_at_current_stage = 1
-        for stage in reversed(df.query(f'subject_id == "{subject_id}"')['current_stage_actual'].to_list()):
-            if stage == current_stage:
-                session_at_current_stage += 1
-            else:
-                break
-
-        return session_at_current_stage
+        return state.count_session_at_current_stage(current_stage)
 
     def compute_stats(self):
         """compute simple stats"""
@@ -148,6 +270,9 @@ class AutoTrainManager:
         highlight_subjects=[],
         if_show_fig=True
     ):
+        # Imported here so that headless updates don't load plotly
+        from aind_auto_train.plot.manager import plot_manager_all_progress
+
         return plot_manager_all_progress(manager=self,
                                          x_axis=x_axis,
                                          sort_by=sort_by,
@@ -157,38 +282,45 @@ class AutoTrainManager:
                                          highlight_subjects=highlight_subjects,
                                          if_show_fig=if_show_fig)
 
-    def _get_next_stage_suggested_on_last_session(self, subject_id, session) -> str:
-        df_this_mouse = self.df_manager.query(f'subject_id == "{subject_id}"')
+    def _get_next_stage_suggested_on_last_session(self, subject_id, session,
+                                                  df_this, state, new_rows) -> str:
+        # Sessions are usually evaluated in order, so the last session is all we need
+        if state.last_session is not None and state.last_session < session:
+            if state.last_session != session - 1:
+                logger.warning(
+                    msg=f"Cannot find subject {subject_id} session {session - 1}, "
+                        f"use session {state.last_session} instead")
+            return state.last_next_stage_suggested
 
-        q_current_stage = df_this_mouse.query(
-            f"session == {session - 1}")['next_stage_suggested']
+        # Otherwise, look up the full history of this subject
+        history = self._get_manager_history(subject_id) + new_rows if state.n_rows else []
+        q_current_stage = [row for row in history if row['session'] == session - 1]
 
         if len(q_current_stage) > 0:
-            return q_current_stage.iloc[0]
+            return q_current_stage[0]['next_stage_suggested']
 
         # Catch missing session or wrong session number
-        id_last_session = df_this_mouse[df_this_mouse.session < session]
-        if len(id_last_session) > 0:
-            id_last_session = id_last_session.session.astype(int).idxmax()
+        last_sessions = [row for row in history if row['session'] < session]
+        if len(last_sessions) > 0:
+            last_session = max(last_sessions, key=lambda row: int(row['session']))
             logger.warning(
                 msg=f"Cannot find subject {subject_id} session {session - 1}, "
-                    f"use session {df_this_mouse.loc[id_last_session].session} instead")
+                    f"use session {last_session['session']} instead")
 
-            return df_this_mouse.loc[id_last_session, 'next_stage_suggested']
+            return last_session['next_stage_suggested']
 
         # Else, (i.e., if session > 1 and no previous session found),
         # assuming "next_stage_suggested" of the last session = "actual_stage" of this session
         # i.e., no override from the trainer
         logger.warning(
             msg=f"subject {subject_id} did not start AutoTrain from session 1.")
-        return self.df_behavior.query(
-            f'subject_id == "{subject_id}" and session == {session}'
-        ).iloc[0]['current_stage_actual']
+        return df_this['current_stage_actual']
 
-    def _get_current_stages(self, subject_id, session) -> dict:
+    def _get_current_stages(self, subject_id, session, df_this, state, new_rows) -> dict:
         # Hardcode first suggested stage here. Should be extract from the first stage of a curriculum.
         current_stage_suggested = 'STAGE_1_WARMUP' if session == 1 \
-            else self._get_next_stage_suggested_on_last_session(subject_id, session)
+            else self._get_next_stage_suggested_on_last_session(subject_id, session,
+                                                                df_this, state, new_rows)
 
         if self.if_simulation_mode:
             # Assuming current session uses the suggested stage from the previous session
@@ -197,9 +329,7 @@ class AutoTrainManager:
                     'if_closed_loop': False}
 
         # If not in simulation mode, use the actual stage
-        current_stage_actual = self.df_behavior.query(
-            f'subject_id == "{subject_id}" and session == {session}'
-        )['current_stage_actual'].iloc[0]
+        current_stage_actual = df_this['current_stage_actual']
 
         # If current_stage_actual not in TrainingStage (including None), then we are in open loop for this specific session
         if current_stage_actual not in TrainingStage.__members__:
@@ -219,8 +349,7 @@ class AutoTrainManager:
                 'current_stage_actual': current_stage_actual,
                 'if_closed_loop': True}
 
-    def _get_curriculum_to_use(self, df_this):
-        dict_this = df_this.to_dict(orient='records')[0]
+    def _get_curriculum_to_use(self, dict_this):
         if 'curriculum_version' in dict_this:
             return self.curriculum_manager.get_curriculum(
                 # Note the distinguish between 'curriculum_name' and 'task'
@@ -238,10 +367,22 @@ class AutoTrainManager:
                 curriculum_schema_version='1.0',
             )
 
-    def add_and_evaluate_session(self, subject_id, session):
-        """ Add a session to the curriculum manager and evaluate the transition """
+    def _evaluate_session(self, subject_id, session, metrics_history, state, new_rows,
+                          n_arrived=None) -> dict:
+        """ Evaluate the transition of one session and return the new df_manager row
+
+        metrics_history: MetricsHistory of this subject
+        state: SubjectState of this subject, including new_rows
+        new_rows: new rows of this subject not added to df_manager yet
+        n_arrived: number of sessions in the recorded metrics history (for compact metrics)
+        Returns None if the session is skipped.
+        """
+        # The row of this session in df_behavior
+        df_this = self.df_behavior.iloc[self._behavior_index.position(subject_id, session)]
+
         # Get current stages
-        _current_stages = self._get_current_stages(subject_id, session)
+        _current_stages = self._get_current_stages(subject_id, session, df_this,
+                                                   state, new_rows)
         current_stage_suggested = _current_stages['current_stage_suggested']
         current_stage_actual = _current_stages['current_stage_actual']
         if_closed_loop = _current_stages['if_closed_loop']
@@ -251,20 +392,12 @@ class AutoTrainManager:
             logger.error(f'Skipping this session...')
             return
 
-        # Get metrics history (sorted by session)
-        df_history = self.df_behavior.query(
-            f'subject_id == "{subject_id}" and session <= {session}'
-        ).sort_values(by=['session'], ascending=True)
-
-        # Task-specific metrics
-        task_specific_metrics = {
-            perf_key: df_history[perf_key].to_list()
-            for perf_key in self.task_specific_metrics_keys
-        }
+        # Task-specific metrics (views of the history sorted by session)
+        task_specific_metrics = metrics_history.up_to(session)
 
         # Count session_at_current_stage
         session_at_current_stage = self._count_session_at_current_stage(
-            self.df_manager, subject_id, current_stage_actual)
+            state, current_stage_actual)
 
         # Evaluate
         metrics = dict(**task_specific_metrics,
@@ -272,9 +405,7 @@ class AutoTrainManager:
                        session_at_current_stage=session_at_current_stage)
 
         # Get the curriculum to use
-        df_this = self.df_behavior.query(
-            f'subject_id == "{subject_id}" and session == {session}')        
-        _curr = self._get_curriculum_to_use(df_this)
+        _curr = self._get_curriculum_to_use(df_this.to_dict())
 
         if _curr is None:  # If no curriculum is found
             logger.error(
@@ -288,76 +419,206 @@ class AutoTrainManager:
         # Evaluate the transition with the desired curriculum
         decision, next_stage_suggested = curriculum_to_use.evaluate_transitions(
             current_stage=TrainingStage[current_stage_actual],
-            metrics=metrics_to_use(**metrics))
-
-        # Add to the manager
-        df_this = self.df_behavior.query(
-            f'subject_id == "{subject_id}" and session == {session}').iloc[0]
-        self.df_manager = pd.concat(
-            [self.df_manager,
-             pd.DataFrame.from_records([dict(
-                 subject_id=subject_id,
-                 session_date=df_this.session_date,
-                 session=session,
-                 task=task_mapper[df_this.task],
-                 curriculum_name=curriculum_to_use.curriculum_name,
-                 curriculum_schema_version=curriculum_to_use.curriculum_schema_version,
-                 curriculum_version=curriculum_to_use.curriculum_version,
-                 curriculum_json_name=curriculum_json,
-                 session_at_current_stage=session_at_current_stage,
-                 current_stage_suggested=current_stage_suggested,
-                 # Note this could be from simulation or invalid feedback-induced open loop session
-                 current_stage_actual=current_stage_actual,
-                 if_closed_loop=if_closed_loop,
-                 if_overriden_by_trainer=current_stage_actual != current_stage_suggested if if_closed_loop else False,
-
-                 # Copy task-specific metrics
-                 **{key: df_this[key] for key in self.task_specific_metrics_keys},
-                 metrics=metrics,
-                 decision=decision.name,
-                 next_stage_suggested=next_stage_suggested.name
-             )])
-             ], ignore_index=True)
+            metrics=metrics_to_use.from_history(**metrics))
 
         # Logging
         logger.info(f"{subject_id}, {df_this.session_date}, session {session}: " +
                     (f"STAY at {current_stage_actual}" if decision.name == 'STAY'
                      else f"{decision.name} {current_stage_actual} --> {next_stage_suggested.name}"))
 
-    def update(self):
-        """update each mouse's training stage"""
-        
-        # Update df_behavior
+        return dict(
+            subject_id=subject_id,
+            session_date=df_this.session_date,
+            session=session,
+            task=task_mapper[df_this.task],
+            curriculum_name=curriculum_to_use.curriculum_name,
+            curriculum_schema_version=curriculum_to_use.curriculum_schema_version,
+            curriculum_version=curriculum_to_use.curriculum_version,
+            curriculum_json_name=curriculum_json,
+            session_at_current_stage=session_at_current_stage,
+            current_stage_suggested=current_stage_suggested,
+            # Note this could be from simulation or invalid feedback-induced open loop session
+            current_stage_actual=current_stage_actual,
+            if_closed_loop=if_closed_loop,
+            if_overriden_by_trainer=current_stage_actual != current_stage_suggested if if_closed_loop else False,
+
+            # Copy task-specific metrics
+            **{key: df_this[key] for key in self.task_specific_metrics_keys},
+            metrics=({'n_history': len(next(iter(task_specific_metrics.values()), [])),
+                      'n_arrived': n_arrived,
+                      'session_total': session,
+                      'session_at_current_stage': session_at_current_stage}
+                     if self.if_compact_metrics else
+                     {**{key: value.tolist() for key, value in task_specific_metrics.items()},
+                      'session_total': session,
+                      'session_at_current_stage': session_at_current_stage}),
+            decision=decision.name,
+            next_stage_suggested=next_stage_suggested.name
+        )
+
+    def _evaluate_subject(self, subject_id, sessions) -> list:
+        """ Replay the new sessions of one subject against its curriculum in a single pass
+
+        sessions: new sessions to evaluate (in order)
+        Returns a list of new df_manager rows
+        """
+        metrics_history = MetricsHistory(self._get_behavior_this(subject_id),
+                                         self.task_specific_metrics_keys)
+        n_arrived = None
+        if self.if_compact_metrics:
+            # Record the history these sessions are evaluated on
+            n_arrived = record_metrics_history(
+                self._get_metrics_histories().setdefault(subject_id, {'session': []}),
+                metrics_history)
+        states = self._get_subject_states()
+        state = states.get(subject_id, SubjectState())
+        new_rows = []
+        for session in sessions:
+            row = self._evaluate_session(subject_id, session, metrics_history, state, new_rows,
+                                         n_arrived=n_arrived)
+            if row is None:
+                continue
+            state.advance(row['current_stage_actual'], row['session'], row['next_stage_suggested'])
+            new_rows.append(row)
+
+        if state.n_rows:
+            states[subject_id] = state
+        return new_rows
+
+    def _get_shard(self, subject_ids) -> 'AutoTrainManager':
+        """ A light copy of this manager that only holds the data of {subject_ids},
+        so that it can be sent to a worker process
+        """
+        shard = object.__new__(self.__class__)
+        shard.manager_name = self.manager_name
+        shard.task_specific_metrics_keys = self.task_specific_metrics_keys
+        shard.if_simulation_mode = self.if_simulation_mode
+        shard.if_compact_metrics = self.if_compact_metrics
+        shard.curriculum_manager = self.curriculum_manager
+        shard._df_manager_buffer = RowBuffer()
+        shard._behavior_index = SessionIndex()
+        shard._manager_index = SessionIndex()
+
+        shard.df_behavior = self.df_behavior.iloc[
+            [i for subject_id in subject_ids for i in self._behavior_index.rows(subject_id)]]
+        shard.df_manager = self.df_manager.iloc[
+            sorted(i for subject_id in subject_ids for i in self._manager_index.rows(subject_id))]
+
+        states = self._get_subject_states()
+        shard._subject_states = {subject_id: states[subject_id]
+                                 for subject_id in subject_ids if subject_id in states}
+        histories = self._get_metrics_histories()
+        shard._metrics_histories = {subject_id: histories[subject_id]
+                                    for subject_id in subject_ids if subject_id in histories}
+        return shard
+
+    def _evaluate_subjects_in_parallel(self, sessions_to_evaluate: dict, workers: int) -> dict:
+        """ Evaluate subjects in {workers} processes
+
+        sessions_to_evaluate: {subject_id: new sessions to evaluate}
+        Returns {subject_id: new df_manager rows}
+        """
+        subject_ids = list(sessions_to_evaluate)
+        # Use more shards than workers to balance the load
+        shards = [list(ids) for ids in np.array_split(np.array(subject_ids, dtype=object),
+                                                      min(len(subject_ids), workers * 4))]
+
+        new_rows = {}
+        states = self._get_subject_states()
+        histories = self._get_metrics_histories()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_evaluate_shard,
+                                       self._get_shard(ids),
+                                       {subject_id: sessions_to_evaluate[subject_id]
+                                        for subject_id in ids})
+                       for ids in shards]
+            for future in futures:
+                for subject_id, (rows, state, history) in future.result().items():
+                    new_rows[subject_id] = rows
+                    if state.n_rows:
+                        states[subject_id] = state
+                    if history is not None:
+                        histories[subject_id] = history
+        return new_rows
+
+    def add_and_evaluate_session(self, subject_id, session):
+        """ Add a session to the curriculum manager and evaluate the transition """
+        # Add to the manager (materialised when df_manager is read)
+        self._append_to_df_manager(self._evaluate_subject(subject_id, [session]))
+
+    def update(self, workers: int = None):
+        """update each mouse's training stage
+
+        workers: int
+            If > 1, evaluate subjects in this number of processes.
+            The result is the same as the serial run.
+        """
+        self.update_download()
+        self.update_evaluate(workers=workers)
+        self.update_upload()
+
+    # The three stages of update(), which can be run separately to overlap the I/O and the
+    # computation of several managers (see aind_auto_train.util.pipeline)
+    def update_download(self):
+        """ Stage 1 of update(): download the latest df_behavior """
         self.df_behavior, _ = self.download_from_database()
-        
-        session_key = ['subject_id', 'session']
-
-        # Diff the to dataframe to find the new mice / new sessions
-        df_merge = self.df_behavior.merge(self.df_manager, on=session_key,
-                                          how='left', indicator=True)
-        df_new_sessions_all = self.df_behavior[df_merge['_merge']
-                                               == 'left_only']
+
+    def update_evaluate(self, workers: int = None):
+        """ Stage 2 of update(): evaluate all new sessions and compute the stats """
+        # Diff the two tables to find the new mice / new sessions
+        # (sessions whose (subject_id, session) is not indexed in df_manager yet)
+        df_new_sessions_all = self.df_behavior[
+            ~self._manager_index.isin(self.df_behavior)]
         unique_subjects_to_evaluate = df_new_sessions_all[
             'subject_id'].unique()
         logger.info(
             f"Found {len(df_new_sessions_all)} new sessions from "
             f"{len(unique_subjects_to_evaluate)} mice to evaluate")
 
-        # Loop over all mouse
-        for subject_id in unique_subjects_to_evaluate:
-            df_new_sessions = df_new_sessions_all.query(
-                f'subject_id == "{subject_id}"')
-            # Loop over all new sessions
-            for session in df_new_sessions['session']:
-                self.add_and_evaluate_session(subject_id, session)
+        # Replay all new sessions of each mouse into the row buffer
+        sessions_to_evaluate = {
+            subject_id: sessions.to_list() for subject_id, sessions in
+            df_new_sessions_all.groupby('subject_id', sort=False)['session']}
+
+        if workers is not None and workers > 1 and len(sessions_to_evaluate) > 1:
+            new_rows = self._evaluate_subjects_in_parallel(sessions_to_evaluate, workers)
+            # Merge in the same order as the serial run
+            for subject_id in unique_subjects_to_evaluate:
+                self._append_to_df_manager(new_rows[subject_id])
+        else:
+            for subject_id in unique_subjects_to_evaluate:
+                self._append_to_df_manager(self._evaluate_subject(
+                    subject_id, sessions=sessions_to_evaluate[subject_id]))
+
+        # Add all new rows to df_manager at once
+        self._materialize_df_manager()
 
         # Compute stats
         self.compute_stats()
 
+    def update_upload(self):
+        """ Stage 3 of update(): upload the results """
         # Save to local cache folder
         self.upload_to_database()
 
 
+def _evaluate_shard(shard: AutoTrainManager, sessions_to_evaluate: dict) -> dict:
+    """ Evaluate subjects of a shard in a worker process
+    Returns {subject_id: (new df_manager rows, SubjectState, recorded metrics history or None)}
+    """
+    results = {}
+    for subject_id, sessions in sessions_to_evaluate.items():
+        rows = shard._evaluate_subject(subject_id, sessions)
+        results[subject_id] = (rows, shard._get_subject_states().get(subject_id, SubjectState()),
+                               shard._get_metrics_histories().get(subject_id))
+    return results
+
+
+def _row_key(df: pd.DataFrame, i: int) -> list:
+    """ [subject_id, session] of the {i}-th row (json serializable) """
+    return [str(df['subject_id'].iloc[i]), float(df['session'].iloc[i])]
+
+
 class DynamicForagingAutoTrainManager(AutoTrainManager):
 
     _metrics_model = DynamicForagingMetrics  # Override the metrics model
@@ -371,6 +632,12 @@ class DynamicForagingAutoTrainManager(AutoTrainManager):
                                            file_name='df_sessions.pkl'),
             df_manager_root_on_s3: dict = dict(bucket='aind-behavior-data',
                                                root='foraging_auto_training/'),
+            if_incremental_download: bool = False,
+            incremental_lookback_days: int = 30,
+            local_cache_dir: str = None,
+            if_partitioned_df_manager: bool = False,
+            max_df_manager_partitions: int = 200,
+            if_compact_metrics: bool = False,
     ):
         """
         manager_name: str
@@ -379,28 +646,148 @@ class DynamicForagingAutoTrainManager(AutoTrainManager):
             Full path to the behavior master table.
         df_manager_root_on_s3: dict
             Root path to the manager table.
+        if_incremental_download: bool
+            If True, df_behavior is cached in memory and each download only merges
+            the sessions (subject_id, session) not in the cache yet into it.
+            Sessions already in the cache are not refreshed if they change upstream.
+            If df_behavior_on_s3['file_name'] is a glob pattern of partitions
+            (e.g. 'df_sessions/*.pkl'), only partitions not loaded yet are read.
+        incremental_lookback_days: int
+            In incremental mode, Parquet tables are only read from this many days before
+            the latest session_date in the cache (row groups older than that are skipped),
+            so that sessions processed late are still picked up.
+        local_cache_dir: str
+            If set, tables downloaded from s3 are cached in this local folder and
+            only downloaded again when they have changed (checked by ETag).
+        if_partitioned_df_manager: bool
+            If True, df_manager is stored as append-only partitions in 'df_manager_{manager_name}/'
+            (with a manifest.json), so each upload only writes the new rows.
+            df_manager_{manager_name}.pkl is not written; other readers can use
+            aind_auto_train.util.aws_util.import_partitioned_df_from_s3().
+        max_df_manager_partitions: int
+            When this number of partitions is reached, all partitions are compacted into one.
+        if_compact_metrics: bool
+            If True, the `metrics` of each df_manager row only store the length of the history,
+            and the history of each subject, as recorded when its sessions were evaluated,
+            is saved once in df_metrics_history_{manager_name}.pkl.
+            Use expand_metrics_column() (or get_full_metrics()) to rebuild the full metrics.
         """
 
         # --- define database names ---
         self.df_manager_name = f'df_manager_{manager_name}.pkl'
         self.df_manager_stats_name = f'df_manager_stats_{manager_name}.pkl'
+        self.df_subject_states_name = f'df_subject_states_{manager_name}.pkl'
+        self.df_metrics_history_name = f'df_metrics_history_{manager_name}.pkl'
+        self.if_compact_metrics = if_compact_metrics
         self.df_manager_root_on_s3 = df_manager_root_on_s3
         self.df_behavior_on_s3 = df_behavior_on_s3
 
+        # --- cache for incremental download of df_behavior ---
+        self.if_incremental_download = if_incremental_download
+        self.incremental_lookback_days = incremental_lookback_days
+        self._df_behavior_cache = None
+        self._loaded_partitions = set()
+
+        self.local_cache_dir = local_cache_dir
+
+        # --- partitioned df_manager ---
+        self.if_partitioned_df_manager = if_partitioned_df_manager
+        self.max_df_manager_partitions = max_df_manager_partitions
+        self.df_manager_partitions_root = f'{df_manager_root_on_s3["root"]}df_manager_{manager_name}/'
+        self._df_manager_manifest = None  # Manifest of the stored partitions
+
         super().__init__(manager_name=manager_name, if_rerun_all=if_rerun_all)
 
+        # The stored partitions are outdated if df_manager has been reset
+        self._if_rewrite_df_manager = if_rerun_all
+
     def download_from_database(self):
         # --- load df_auto_train_manager and df_behavior from s3 ---
-        df_behavior = import_df_from_s3(bucket=self.df_behavior_on_s3['bucket'],
-                                        s3_path=self.df_behavior_on_s3['root'],
-                                        file_name=self.df_behavior_on_s3['file_name'],
-                                        )
+        df_behavior = self._import_df_behavior()
+
+        if df_behavior is not None:
+            df_behavior = self._format_df_behavior(df_behavior)
+
+        if self.if_incremental_download:
+            df_behavior = self._merge_into_df_behavior_cache(df_behavior)
 
         if df_behavior is None:
             logger.error('No df_behavior found, exiting...')
             return
 
-        # --- Formatting the behavior master table ---
+        # --- Load curriculum manager table; if not exist, create a new one ---
+        if self.if_partitioned_df_manager:
+            df_manager = self._import_df_manager_partitions()
+        else:
+            df_manager = import_df_from_s3(bucket=self.df_manager_root_on_s3['bucket'],
+                                           s3_path=self.df_manager_root_on_s3['root'],
+                                           file_name=self.df_manager_name,
+                                           cache_dir=self.local_cache_dir,
+                                           )
+
+        return df_behavior, df_manager
+
+    def _get_df_behavior_columns(self) -> list:
+        """ Columns of the raw behavior master table used by the manager """
+        return ['subject_id', 'session', 'session_date', 'task', 'h2o',
+                'curriculum_name', 'curriculum_version', 'curriculum_schema_version',
+                'current_stage_actual',
+                'foraging_eff',  # Raw name of foraging_efficiency
+                *[key for key in self._metrics_model.model_fields
+                  if key not in Metrics.model_fields]]
+
+    def _import_df_behavior(self) -> pd.DataFrame:
+        """ Import the raw behavior master table (only new partitions in incremental mode) """
+        file_name = self.df_behavior_on_s3['file_name']
+
+        # For Parquet tables, only read the columns we need
+        # (and in incremental mode, only the row groups since the high-water mark minus the lookback)
+        read_kwargs = dict(columns=self._get_df_behavior_columns(),
+                           cache_dir=self.local_cache_dir)
+        # (partitions are not filtered, since only the new ones are read)
+        if (self.if_incremental_download and self._df_behavior_cache is not None
+                and file_name.endswith('.parquet') and '*' not in file_name):
+            watermark = self._df_behavior_cache['session_date'].max()
+            if pd.notna(watermark):
+                read_kwargs['filters'] = [
+                    ('session_date', '>=',
+                     watermark - datetime.timedelta(days=self.incremental_lookback_days))]
+
+        if '*' not in file_name:
+            return import_df_from_s3(bucket=self.df_behavior_on_s3['bucket'],
+                                     s3_path=self.df_behavior_on_s3['root'],
+                                     file_name=file_name,
+                                     **read_kwargs,
+                                     )
+
+        # Partitioned behavior master table
+        partitions = glob_s3(bucket=self.df_behavior_on_s3['bucket'],
+                             s3_path=self.df_behavior_on_s3['root'],
+                             pattern=file_name)
+        if partitions is None:
+            return None
+        if self.if_incremental_download:
+            partitions = [p for p in partitions if p not in self._loaded_partitions]
+        logger.info(f'Reading {len(partitions)} partitions of df_behavior')
+
+        dfs = []
+        for partition in partitions:
+            df = import_df_from_s3(bucket=self.df_behavior_on_s3['bucket'],
+                                   s3_path=self.df_behavior_on_s3['root'],
+                                   file_name=partition,
+                                   **read_kwargs,
+                                   )
+            if df is None:
+                continue
+            dfs.append(df)
+            if self.if_incremental_download:
+                self._loaded_partitions.add(partition)
+
+        return pd.concat(dfs) if dfs else None
+
+    @staticmethod
+    def _format_df_behavior(df_behavior: pd.DataFrame) -> pd.DataFrame:
+        """ Formatting the behavior master table """
         # Remove multiIndex on columns, if any
         if df_behavior.columns.nlevels > 1:
             df_behavior.columns = df_behavior.columns.droplevel(
@@ -422,19 +809,145 @@ class DynamicForagingAutoTrainManager(AutoTrainManager):
         df_behavior.rename(
             columns={'foraging_eff': 'foraging_efficiency'}, inplace=True)
 
-        # --- Load curriculum manager table; if not exist, create a new one ---
-        df_manager = import_df_from_s3(bucket=self.df_manager_root_on_s3['bucket'],
-                                       s3_path=self.df_manager_root_on_s3['root'],
-                                       file_name=self.df_manager_name,
-                                       )
+        return df_behavior
 
-        return df_behavior, df_manager
+    def _merge_into_df_behavior_cache(self, df_behavior: pd.DataFrame) -> pd.DataFrame:
+        """ Append new sessions of {df_behavior} to the cached df_behavior
+
+        Only sessions (subject_id, session) not in the cache yet are appended, whatever their date,
+        so rows already in the cache keep their positions.
+        Rows already in the cache are not refreshed, even if they have changed upstream.
+        """
+        if self._df_behavior_cache is None:
+            self._df_behavior_cache = df_behavior
+            return self._df_behavior_cache
+        if df_behavior is None:  # Nothing new
+            return self._df_behavior_cache
+
+        cached_keys = pd.MultiIndex.from_arrays([self._df_behavior_cache['subject_id'],
+                                                 self._df_behavior_cache['session']])
+        df_new = df_behavior[~pd.MultiIndex.from_arrays(
+            [df_behavior['subject_id'], df_behavior['session']]).isin(cached_keys)]
+
+        logger.info(f'{len(df_new)} new sessions merged into df_behavior')
+        if len(df_new):
+            self._df_behavior_cache = pd.concat([self._df_behavior_cache, df_new],
+                                                ignore_index=True)
+        return self._df_behavior_cache
+
+    def download_subject_states_from_database(self):
+        return import_df_from_s3(bucket=self.df_manager_root_on_s3['bucket'],
+                                 s3_path=self.df_manager_root_on_s3['root'],
+                                 file_name=self.df_subject_states_name,
+                                 cache_dir=self.local_cache_dir,
+                                 )
+
+    def download_metrics_history_from_database(self):
+        return import_df_from_s3(bucket=self.df_manager_root_on_s3['bucket'],
+                                 s3_path=self.df_manager_root_on_s3['root'],
+                                 file_name=self.df_metrics_history_name,
+                                 cache_dir=self.local_cache_dir,
+                                 )
+
+    def _import_df_manager_partitions(self) -> pd.DataFrame:
+        """ Read all partitions of df_manager listed in the manifest (None if there is no manifest yet)
+
+        Raises if the manifest or a partition can't be read, rather than starting a new df_manager
+        """
+        result = import_partitioned_df_from_s3(bucket=self.df_manager_root_on_s3['bucket'],
+                                               s3_path=self.df_manager_partitions_root,
+                                               cache_dir=self.local_cache_dir,
+                                               return_manifest=True)
+        if result is None:
+            return None
+        df_manager, self._df_manager_manifest = result
+        return df_manager
+
+    def _list_df_manager_partitions(self) -> dict:
+        """ {generation: [file names]} of all partitions of df_manager on s3,
+        including those not in the manifest (e.g. left by a failed upload)
+        """
+        partitions = {}
+        for file_name in glob_s3(bucket=self.df_manager_root_on_s3['bucket'],
+                                 s3_path=self.df_manager_partitions_root,
+                                 pattern='part-*.pkl') or []:
+            match = re.fullmatch(r'part-(\d+)-\d+\.pkl', file_name)
+            if match:
+                partitions.setdefault(int(match.group(1)), []).append(file_name)
+        return partitions
+
+    def _export_df_manager_partitions(self):
+        """ Append the rows added since the last upload as a new partition of df_manager
+
+        All rows are rewritten as a new generation of partitions if df_manager has been reset
+        (or no longer starts with the stored rows), or if there are too many partitions.
+        """
+        df_manager = self.df_manager
+        manifest = self._df_manager_manifest
+        n_stored = manifest['n_rows'] if manifest else 0
+
+        if_append = (manifest is not None
+                     and not self._if_rewrite_df_manager
+                     and len(manifest['parts']) < self.max_df_manager_partitions
+                     and n_stored <= len(df_manager)
+                     and (n_stored == 0 or _row_key(df_manager, n_stored - 1) == manifest['last_key']))
+        if if_append:
+            if n_stored == len(df_manager):
+                return  # Nothing new
+            generation, parts = manifest['generation'], list(manifest['parts'])
+            df_new = df_manager.iloc[n_stored:]
+        else:
+            # Start a generation after all generations on s3, so that no partition a manifest
+            # may still refer to is overwritten
+            existing = self._list_df_manager_partitions()
+            generation = max([*existing, manifest['generation'] if manifest else -1]) + 1
+            parts = []
+            df_new = df_manager
+
+        file_name = f'part-{generation:04d}-{len(parts):05d}.pkl'
+        if not export_df_to_s3(df=df_new,
+                               bucket=self.df_manager_root_on_s3['bucket'],
+                               s3_path=self.df_manager_partitions_root,
+                               file_name=file_name,
+                               ):
+            return
+        parts.append(dict(file_name=file_name, n_rows=len(df_new)))
+
+        # The manifest is written after the partition, so readers never see a missing partition
+        new_manifest = dict(generation=generation,
+                            n_rows=len(df_manager),
+                            last_key=_row_key(df_manager, len(df_manager) - 1) if len(df_manager) else None,
+                            parts=parts)
+        if not export_json_to_s3(new_manifest,
+                                 bucket=self.df_manager_root_on_s3['bucket'],
+                                 s3_path=self.df_manager_partitions_root,
+                                 file_name='manifest.json'):
+            return
+        logger.info(f'{len(df_new)} rows written to partition {file_name} of df_manager')
+
+        # Remove the partitions older than the previous generation. The previous generation is
+        # only removed at the next rewrite, so that readers of the previous manifest can finish
+        if not if_append:
+            delete_files_on_s3([file_name for old_generation, file_names in existing.items()
+                                if old_generation < generation - 1 for file_name in file_names],
+                               bucket=self.df_manager_root_on_s3['bucket'],
+                               s3_path=self.df_manager_partitions_root)
+
+        self._df_manager_manifest = new_manifest
+        self._if_rewrite_df_manager = False
 
     def upload_to_database(self):
         """Upload s3"""
 
-        df_to_upload = {self.df_manager_name: self.df_manager,
-                        self.df_manager_stats_name: self.df_manager_stats}
+        if self.if_partitioned_df_manager:
+            self._export_df_manager_partitions()
+            df_to_upload = {}
+        else:
+            df_to_upload = {self.df_manager_name: self.df_manager}
+        df_to_upload.update({self.df_manager_stats_name: self.df_manager_stats,
+                             self.df_subject_states_name: self.df_subject_states})
+        if self.if_compact_metrics:
+            df_to_upload[self.df_metrics_history_name] = self.df_metrics_history
 
         for file_name, df in df_to_upload.items():
             export_df_to_s3(df=df,
@@ -4,18 +4,21 @@ Get data from the behavior master table and give suggestions
 # %%
 import os
 import logging
-import re
 import glob
 import json
 import importlib
 import inspect
+import hashlib
+from collections import OrderedDict
 
 import numpy as np
 import pandas as pd
 from typing import Any, Generic
 
 from aind_auto_train.schema.task import Task
-from aind_auto_train.util.aws_util import download_dir_from_s3, upload_dir_to_s3
+from aind_auto_train.util.aws_util import sync_dir_from_s3, upload_dir_to_s3
+from aind_auto_train.util.curriculum_util import (sync_manifest, pack_bundle, CurriculumBundle,
+                                                  BUNDLE_FILE_NAME)
 import aind_auto_train.schema.curriculum as curriculum_schemas
 import aind_auto_train.schema.task as task_schemas
 
@@ -36,57 +39,74 @@ class CurriculumManager:
     def __init__(self,
                  saved_curriculums_on_s3: dict = dict(bucket='aind-behavior-data',
                                                       root='foraging_auto_training/saved_curriculums/'),
-                 saved_curriculums_local=LOCAL_SAVED_CURRICULUM_ROOT
+                 saved_curriculums_local=LOCAL_SAVED_CURRICULUM_ROOT,
+                 cache_size: int = 32,
+                 include: list = None,
+                 use_bundle: bool = False,
+                 snapshot_dir: str = None,
                  ):
+        """
+        include: list of str
+            fnmatch patterns of the files to download (e.g. ['*.json'] to skip the diagrams).
+            By default, download all files.
+        use_bundle: bool
+            If True, only download the curriculum bundle (one file) and read the curriculums from it.
+        snapshot_dir: str
+            Local folder of the pre-validated curriculum snapshots.
+            By default, curriculum_schemas.SNAPSHOT_CACHE_DIR.
+        """
 
         self.saved_curriculums_on_s3 = saved_curriculums_on_s3
         self.saved_curriculums_local = saved_curriculums_local
+        self.include = include
+        self.use_bundle = use_bundle
+        self._bundle = None
+        self.snapshot_dir = snapshot_dir
+
+        # LRU cache of loaded curriculums:
+        # (curriculum_name, curriculum_version, curriculum_schema_version) -> (file hash, curriculum dict)
+        self.cache_size = cache_size
+        self._curriculum_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
         self.download_curriculums()
 
     def df_curriculums(self) -> pd.DataFrame:
-        """ Return the master table of all curriculums
+        """ Return the master table of all curriculums (from the manifest of curriculums)
         """
+        manifest = (self._bundle.manifest if self._bundle
+                    else sync_manifest(self.saved_curriculums_local, self.json_files))
 
-        df_curriculums = pd.DataFrame(columns=[
-                                      'curriculum_name',
-                                      'curriculum_version',
-                                      'curriculum_schema_version',
-                                      'curriculum_description'])
-        
         schema_version_code_base = curriculum_schemas.Curriculum.model_fields['curriculum_schema_version'].default
-        
-        for f in self.json_files:
-            match = re.search(r'(.+)_curriculum_v(.+)_schema_v(.+)\.json',
-                              os.path.basename(f))
-            if match is None:
-                logger.warning(
-                    f"Could not parse {os.path.basename(f)} as a curriculum json file.")
-                continue
-            curriculum_name, curriculum_version, curriculum_schema_version = match.groups()
-            
-            # Only show curriculums whose curriculum_schema_version matches the current codebase
-            if schema_version_code_base != curriculum_schema_version:
-                continue
-            
-            df_curriculums = pd.concat(
-                [df_curriculums,
-                 pd.DataFrame.from_records([dict(curriculum_name=curriculum_name,
-                                                 curriculum_version=curriculum_version,
-                                                 curriculum_schema_version=curriculum_schema_version,
-                                                 curriculum_description=json.load(
-                                                     open(f, 'r'))['curriculum_description']
-                                                 )]
-                                           )
-                 ], ignore_index=True)
-
-        return df_curriculums
+
+        # Only show curriculums whose curriculum_schema_version matches the current codebase
+        return pd.DataFrame(
+            [entry for entry in (manifest.get(os.path.basename(f)) for f in self.json_files)
+             if entry is not None
+             and entry['curriculum_schema_version'] == schema_version_code_base],
+            columns=['curriculum_name',
+                     'curriculum_version',
+                     'curriculum_schema_version',
+                     'curriculum_description'],
+            dtype=object)
 
     def get_curriculum(self,
                        curriculum_name: Task,
                        curriculum_schema_version: str,
                        curriculum_version: str
                        ) -> dict:
-        """ Get a curriculum from the saved_curriculums directory"""
+        """ Get a curriculum from the saved_curriculums directory
+
+        Loaded curriculums are cached, so the same (name, version, schema version)
+        returns the same objects until the file is changed by download_curriculums().
+        """
+        key = (curriculum_name, curriculum_version, curriculum_schema_version)
+        if key in self._curriculum_cache:
+            self._curriculum_cache.move_to_end(key)
+            self.cache_hits += 1
+            return self._curriculum_cache[key][1]
+        self.cache_misses += 1
 
         json_name = (f"{curriculum_name}_"
                      f"curriculum_v{curriculum_version}_"
@@ -94,8 +114,8 @@ class CurriculumManager:
 
         # Load json
         try:
-            with open(self.saved_curriculums_local + json_name, 'r') as f:
-                loaded_json = json.load(f)
+            content = self._read_curriculum_json(json_name)
+            loaded_json = json.loads(content)
         except FileNotFoundError:
             logger.error(
                 f"Could not find {json_name} in {self.saved_curriculums_local}")
@@ -126,8 +146,11 @@ class CurriculumManager:
                          f"You're either using an outdated `aind_auto_train` repo or loading an outdated curriculum!")
             return None
 
-        # Create the curriculum object
-        curriculum = curriculum_schema(**loaded_json)
+        # Create the curriculum object (from the pre-validated snapshot if it is up to date)
+        curriculum = curriculum_schemas.load_snapshot(json_name, content, self.snapshot_dir)
+        if not isinstance(curriculum, curriculum_schema):
+            curriculum = curriculum_schema(**loaded_json)
+            curriculum_schemas.save_snapshot(curriculum, json_name, content, self.snapshot_dir)
         logger.info(
             f"Loaded a {curriculum_schema_name} model from '{json_name}'.")
 
@@ -144,28 +167,112 @@ class CurriculumManager:
 
         metrics = getattr(task_schemas, metrics_schema_name)
 
-        return {'curriculum': curriculum,
-                'metrics': metrics,
-                'curriculum_json_name': self.saved_curriculums_local + json_name,
-                'diagram_paras_name':  self.saved_curriculums_local + json_name.replace('.json', '_paras.svg'),
-                'diagram_rules_name': self.saved_curriculums_local + json_name.replace('.json', '_rules.svg'),
-                }
+        loaded = {'curriculum': curriculum,
+                  'metrics': metrics,
+                  'curriculum_json_name': self.saved_curriculums_local + json_name,
+                  'diagram_paras_name':  self.saved_curriculums_local + json_name.replace('.json', '_paras.svg'),
+                  'diagram_rules_name': self.saved_curriculums_local + json_name.replace('.json', '_rules.svg'),
+                  }
+
+        # Cache it (and evict the least recently used one if full)
+        self._curriculum_cache[key] = (hashlib.md5(content).hexdigest(), loaded)
+        while len(self._curriculum_cache) > self.cache_size:
+            self._curriculum_cache.popitem(last=False)
+
+        return loaded
+
+    def cache_info(self) -> dict:
+        """ Hit/miss counters of the curriculum cache """
+        return dict(hits=self.cache_hits,
+                    misses=self.cache_misses,
+                    size=len(self._curriculum_cache),
+                    max_size=self.cache_size)
+
+    def clear_cache(self):
+        self._curriculum_cache.clear()
+
+    def _read_curriculum_json(self, json_name: str) -> bytes:
+        """ Content of a curriculum json (from the bundle if used) """
+        if self._bundle:
+            return self._bundle.read(json_name)
+        with open(self.saved_curriculums_local + json_name, 'rb') as f:
+            return f.read()
+
+    def _invalidate_changed_curriculums(self):
+        """ Drop cached curriculums whose json file has changed (or disappeared) """
+        for key, (file_hash, loaded) in list(self._curriculum_cache.items()):
+            try:
+                content = self._read_curriculum_json(
+                    os.path.basename(loaded['curriculum_json_name']))
+                if hashlib.md5(content).hexdigest() == file_hash:
+                    continue
+            except FileNotFoundError:
+                pass
+            logger.info(f"Curriculum {key} has changed, removed from cache.")
+            del self._curriculum_cache[key]
+
+    def _sync_curriculums(self, include: list):
+        # Only download new or changed files
+        sync_dir_from_s3(bucket=self.saved_curriculums_on_s3['bucket'],
+                         s3_dir=self.saved_curriculums_on_s3['root'],
+                         local_dir=self.saved_curriculums_local,
+                         include=include,
+                         # Never load pickles from the bucket (snapshots are local only)
+                         exclude=['*' + curriculum_schemas.SNAPSHOT_SUFFIX])
 
     def download_curriculums(self):
-        download_dir_from_s3(bucket=self.saved_curriculums_on_s3['bucket'],
-                             s3_dir=self.saved_curriculums_on_s3['root'],
-                             local_dir=self.saved_curriculums_local)
-
-        self.json_files = glob.glob(
-            self.saved_curriculums_local + '/*_curriculum_*.json')
+        self._sync_curriculums([BUNDLE_FILE_NAME] if self.use_bundle else self.include)
+
+        if self._bundle:
+            self._bundle.close()
+            self._bundle = None
+        if self.use_bundle:
+            try:
+                self._bundle = CurriculumBundle(self.saved_curriculums_local + BUNDLE_FILE_NAME)
+            except FileNotFoundError:
+                logger.error(f"Could not find {BUNDLE_FILE_NAME} in {self.saved_curriculums_local}, "
+                             f"using the curriculum files instead.")
+                self._sync_curriculums(self.include)
+
+        if self._bundle:
+            self.json_files = [self.saved_curriculums_local + name for name in self._bundle.names()]
+        else:
+            self.json_files = glob.glob(
+                self.saved_curriculums_local + '/*_curriculum_*.json')
 
         logger.info(
             f"Found {len(self.json_files)} curriculums in {self.saved_curriculums_local}")
 
+        self._invalidate_changed_curriculums()
+
     def upload_curriculums(self):
+        # With a bundle, the curriculums are not extracted locally. Extract those not edited here,
+        # so that the new bundle still contains them
+        if self._bundle:
+            extracted = self._bundle.extract(self.saved_curriculums_local)
+            logger.info(f"Extracted {len(extracted)} curriculums from {BUNDLE_FILE_NAME}")
+
+        # Make sure the manifest covers all local curriculums before uploading
+        json_files = glob.glob(
+            self.saved_curriculums_local + '/*_curriculum_*.json')
+        if not json_files:
+            logger.error(f"No curriculums found in {self.saved_curriculums_local}, "
+                         f"refusing to upload an empty bundle.")
+            return
+        self.json_files = json_files
+        manifest = sync_manifest(self.saved_curriculums_local, self.json_files)
+
+        # Pack all curriculums into the bundle, which is uploaded together with the files
+        pack_bundle(self.saved_curriculums_local, self.json_files, manifest)
+        if self._bundle:
+            self._bundle.close()
+            self._bundle = CurriculumBundle(self.saved_curriculums_local + BUNDLE_FILE_NAME)
+
         upload_dir_to_s3(bucket=self.saved_curriculums_on_s3['bucket'],
                          s3_dir=self.saved_curriculums_on_s3['root'],
-                         local_dir=self.saved_curriculums_local)
+                         local_dir=self.saved_curriculums_local,
+                         # Local artifacts only (partial writes and pre-validated snapshots)
+                         exclude=['*.tmp', '*' + curriculum_schemas.SNAPSHOT_SUFFIX])
 
 
 if __name__ == "__main__":
@@ -2,9 +2,15 @@
 import json
 import os
 import logging
+import hashlib
+import pickle
+import inspect
+import sys
+import types
 import numpy as np
+import pydantic
 from enum import Enum
-from typing import List, Dict, Generic, Literal
+from typing import List, Dict, Generic, Literal, ClassVar, Callable, get_args
 
 from pydantic import BaseModel, Field
 from pydantic.json import pydantic_encoder
@@ -12,7 +18,8 @@ from pydantic.json import pydantic_encoder
 from aind_auto_train.schema.task import (Task, TrainingStage,
                                          taskparas_class, DynamicForagingParas, DummyTaskParas,
                                          metrics_class, DynamicForagingMetrics, DummyTaskMetrics)
-from aind_auto_train.plot.curriculum import draw_diagram_rules, draw_diagram_paras
+from aind_auto_train.schema.metrics_batch import MetricsBatch, vectorize_condition
+from aind_auto_train.util.curriculum_util import update_manifest
 
 # %%
 logger = logging.getLogger(__name__)
@@ -30,6 +37,27 @@ class TransitionRule(BaseModel):
     condition: str = ""  # A string for lambda function
     condition_description: str = ""
 
+    # Compiled conditions shared by all rules, keyed by the condition text. They are compiled
+    # lazily from the current condition, so that copies and reassignments of the condition
+    # never run a stale function, and invalid conditions only raise when they are evaluated.
+    _compiled_conditions: ClassVar[Dict[str, Callable]] = {}
+    _vectorized_conditions: ClassVar[Dict[str, Callable]] = {}
+
+    def condition_func(self) -> Callable:
+        ''' Return the compiled lambda function of the condition '''
+        condition = self.condition
+        if condition not in self._compiled_conditions:
+            # Turn the string into a lambda function
+            self._compiled_conditions[condition] = eval(condition.replace("\n", ""))
+        return self._compiled_conditions[condition]
+
+    def vectorized_condition_func(self) -> Callable:
+        ''' Return the condition compiled into an array expression on MetricsBatch '''
+        condition = self.condition
+        if condition not in self._vectorized_conditions:
+            self._vectorized_conditions[condition] = vectorize_condition(condition)
+        return self._vectorized_conditions[condition]
+
     class Config:
         validate_assignment = True
 
@@ -87,12 +115,49 @@ class Curriculum(BaseModel, Generic[taskparas_class, metrics_class]):
         # Evaluate the transition rules
         for transition in transition_rules:
             # Check if the condition is met in order
-            # Turn the string into a lambda function
-            func = eval(transition.condition.replace("\n", ""))
+            func = transition.condition_func()
             if func(metrics):
                 return transition.decision, transition.to_stage
         return Decision.STAY, current_stage  # By default, stay at the current stage
 
+    def evaluate_transitions_batch(self,
+                                   current_stage: TrainingStage,
+                                   metrics: MetricsBatch
+                                   ) -> (np.ndarray, np.ndarray):
+        ''' Vectorized evaluate_transitions() for many subjects at the same stage
+        Returns arrays of decisions and next stages (one per subject)
+        '''
+        n_subjects = metrics.n_subjects
+        # (np.full() would turn the str Enums into numpy strings)
+        decisions = np.empty(n_subjects, dtype=object)
+        decisions.fill(Decision.STAY)
+        next_stages = np.empty(n_subjects, dtype=object)
+        next_stages.fill(current_stage)
+
+        # Return if already graduated
+        if current_stage == TrainingStage.GRADUATED:
+            return decisions, next_stages
+
+        # Evaluate the transition rules in order; the first rule met wins
+        undecided = np.ones(n_subjects, dtype=bool)
+        for transition in self.curriculum[current_stage].transition_rules:
+            try:
+                if_met = np.broadcast_to(
+                    transition.vectorized_condition_func()(metrics), (n_subjects,))
+            except (ValueError, TypeError) as e:
+                # Fall back to evaluating the condition subject by subject
+                logger.warning(f"Cannot vectorize condition ({e}), evaluating subject by subject")
+                func = transition.condition_func()
+                if_met = np.array([bool(func(types.SimpleNamespace(**metrics.subject(i))))
+                                   for i in range(n_subjects)], dtype=bool)
+
+            if_met = if_met & undecided
+            decisions[if_met] = transition.decision
+            next_stages[if_met] = transition.to_stage
+            undecided &= ~if_met
+
+        return decisions, next_stages
+
     def get_transition_rule(self,
                             from_stage: TrainingStage,
                             to_stage: TrainingStage):
@@ -114,9 +179,16 @@ class Curriculum(BaseModel, Generic[taskparas_class, metrics_class]):
         path = path or os.path.dirname(__file__)
         f_name_model = path + self._get_export_model_name() + '.json'
         # Dump the model
-        with open(f_name_model, 'w') as f:
-            f.write(self.to_json())
+        content = self.to_json().encode()
+        with open(f_name_model, 'wb') as f:
+            f.write(content)
         logger.info(f"Curriculum saved to {f_name_model}")
+
+        # Register it in the manifest of curriculums
+        update_manifest(path, [f_name_model], [content])
+
+        # Save a pre-validated snapshot for fast loading
+        save_snapshot(self, f_name_model, content)
         
         # Dump the schema as well
         f_name_schema = path + self._get_export_schema_name() + '.json'
@@ -141,6 +213,9 @@ class Curriculum(BaseModel, Generic[taskparas_class, metrics_class]):
                       render_file_format='svg',
                       path=''):
         ''' Show the diagram of the curriculum '''
+        # Imported here so that schema consumers don't load graphviz and matplotlib
+        from aind_auto_train.plot.curriculum import draw_diagram_rules
+
         path = path or os.path.dirname(__file__)
         dot_rules = draw_diagram_rules(self)
         
@@ -159,6 +234,8 @@ class Curriculum(BaseModel, Generic[taskparas_class, metrics_class]):
                       path='',
                       ):
         ''' Show the table for all parameters in all stages'''
+        from aind_auto_train.plot.curriculum import draw_diagram_paras
+
         path = path or os.path.dirname(__file__)
         dot_paras = draw_diagram_paras(self,
                                        min_value_width=min_value_width,
@@ -218,3 +295,93 @@ def transform_dict_with_enum_keys(obj):
     return obj
 
 # %%
+
+
+# ------------------ Snapshots ------------------
+# A snapshot is the pickled (already validated) curriculum, together with a checksum of the json
+# content and of the schema code. Loading an up-to-date snapshot skips the parsing and validation
+# of the json. Snapshots are kept in a local cache folder, never next to the jsons, so that they are
+# not uploaded to or downloaded from s3 (only pickles written on this machine are ever loaded).
+SNAPSHOT_SUFFIX = '.snapshot.pkl'
+SNAPSHOT_CACHE_DIR = os.path.expanduser('~/.cache/aind_auto_train/curriculum_snapshots/')
+_schema_fingerprints: Dict[type, str] = {}
+
+
+def _iter_schema_classes(annotation, seen: set):
+    ''' Yield the classes in {annotation}, with their bases and the classes of their fields '''
+    for arg in get_args(annotation):
+        yield from _iter_schema_classes(arg, seen)
+    if not isinstance(annotation, type):
+        return
+    for cls in annotation.__mro__:
+        if cls in seen:
+            continue
+        seen.add(cls)
+        yield cls
+        if issubclass(cls, BaseModel):
+            for field in cls.model_fields.values():
+                yield from _iter_schema_classes(field.annotation, seen)
+
+
+def _get_schema_fingerprint(curriculum_class: type) -> str:
+    ''' Hash of the code, config and package versions of all the schema classes of {curriculum_class}
+    (so that snapshots are invalidated when the schema changes, including in aind_data_schema) '''
+    if curriculum_class not in _schema_fingerprints:
+        fingerprint = hashlib.md5(pydantic.VERSION.encode())
+        source_files = set()
+        for cls in _iter_schema_classes(curriculum_class, set()):
+            package = sys.modules.get(cls.__module__.split('.')[0])
+            fingerprint.update(f"{cls.__module__}.{cls.__qualname__} "
+                               f"{getattr(package, '__version__', '')} "
+                               f"{getattr(cls, 'model_config', '')!r}\n".encode())
+            try:
+                source_files.add(inspect.getsourcefile(cls))
+            except TypeError:  # Built-in classes
+                pass
+        for f_name in sorted(f for f in source_files if f):
+            with open(f_name, 'rb') as f:
+                fingerprint.update(f.read())
+        _schema_fingerprints[curriculum_class] = fingerprint.hexdigest()
+    return _schema_fingerprints[curriculum_class]
+
+
+def snapshot_checksum(curriculum_class: type, content: bytes) -> str:
+    return hashlib.md5(_get_schema_fingerprint(curriculum_class).encode() + content).hexdigest()
+
+
+def _get_snapshot_file(json_file: str, cache_dir: str = None) -> str:
+    return os.path.join(cache_dir or SNAPSHOT_CACHE_DIR,
+                        os.path.basename(json_file).replace('.json', SNAPSHOT_SUFFIX))
+
+
+def save_snapshot(curriculum: Curriculum, json_file: str, content: bytes, cache_dir: str = None):
+    ''' Save the snapshot of {curriculum}, whose json file {json_file} has {content},
+    in {cache_dir} (SNAPSHOT_CACHE_DIR by default) '''
+    f_name = _get_snapshot_file(json_file, cache_dir)
+    try:
+        os.makedirs(os.path.dirname(f_name), exist_ok=True)
+        with open(f_name, 'wb') as f:
+            pickle.dump({'checksum': snapshot_checksum(type(curriculum), content),
+                         'curriculum': curriculum}, f)
+    except OSError as e:
+        logger.warning(f"Could not save snapshot {f_name}: {e}")
+
+
+def load_snapshot(json_file: str, content: bytes, cache_dir: str = None) -> Curriculum:
+    ''' Load the snapshot of {json_file} from {cache_dir}, or return None if there is no up-to-date snapshot '''
+    f_name = _get_snapshot_file(json_file, cache_dir)
+    try:
+        with open(f_name, 'rb') as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Could not load snapshot {f_name}: {e}")
+        return None
+
+    curriculum = snapshot.get('curriculum')
+    if not isinstance(curriculum, Curriculum) or \
+            snapshot.get('checksum') != snapshot_checksum(type(curriculum), content):
+        logger.info(f"Snapshot {f_name} is outdated.")
+        return None
+    return curriculum
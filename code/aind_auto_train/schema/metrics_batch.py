@@ -0,0 +1,149 @@
+"""
+Metrics of many subjects as NumPy matrices, for vectorized evaluation of transition rules
+
+A transition rule condition like
+    lambda metrics: metrics.finished_trials[-1] >= 300 and np.mean(metrics.foraging_efficiency[-5:]) >= 0.7
+is translated by vectorize_condition() into an array expression, so that it can be evaluated
+on a MetricsBatch of all subjects at once (one boolean per subject).
+"""
+import ast
+
+import numpy as np
+
+
+class HistoryWindow:
+    """ Right-aligned (n_subjects, window) slice of a metric history (with a mask of valid entries) """
+
+    def __init__(self, values: np.ndarray, valid: np.ndarray):
+        self.values = values
+        self.valid = valid
+
+    # np.mean(), np.sum(), np.min() and np.max() call these methods on non-ndarray inputs
+    def sum(self, axis=None, dtype=None, out=None, **kwargs):
+        return np.where(self.valid, self.values, 0).sum(axis=1)
+
+    def mean(self, axis=None, dtype=None, out=None, **kwargs):
+        return self.sum() / self.valid.sum(axis=1)
+
+    def min(self, axis=None, out=None, **kwargs):
+        return np.where(self.valid, self.values, np.inf).min(axis=1)
+
+    def max(self, axis=None, out=None, **kwargs):
+        return np.where(self.valid, self.values, -np.inf).max(axis=1)
+
+
+class HistoryMatrix(HistoryWindow):
+    """ Full (n_subjects, window) history of a metric, supporting the indexing used in conditions
+
+    history[-1]  --> the last value of each subject, shape (n_subjects,)
+    history[-5:] --> HistoryWindow of the last (up to) 5 values of each subject
+    """
+
+    def __getitem__(self, key):
+        window = self.values.shape[1]
+        lengths = self.valid.sum(axis=1)
+
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                cols = np.full(len(lengths), window + key)
+                valid = -key <= lengths
+            else:
+                cols = window - lengths + key
+                valid = key < lengths
+            cols = np.clip(cols, 0, window - 1)
+            values = np.take_along_axis(self.values, cols[:, None], axis=1)[:, 0]
+            # Out-of-range index gives NaN (so that any comparison is False)
+            return np.where(valid, values, np.nan)
+
+        if isinstance(key, slice) and key.step is None and key.stop is None \
+                and (key.start is None or key.start < 0):
+            start = 0 if key.start is None else max(window + key.start, 0)
+            return HistoryWindow(self.values[:, start:], self.valid[:, start:])
+
+        raise ValueError(f'Indexing {key} is not supported in vectorized conditions')
+
+
+class MetricsBatch:
+    """ Metrics of many subjects
+
+    Scalar metrics (e.g. session_total) are arrays of shape (n_subjects,).
+    History metrics (e.g. foraging_efficiency) are HistoryMatrix of shape (n_subjects, window),
+    right-aligned so that the last column is the latest session of every subject.
+    """
+
+    def __init__(self, metrics_list: list, window: int = None):
+        """
+        metrics_list: list of dict
+            Metrics of each subject, in the same format as Metrics (histories as lists or arrays)
+        window: int
+            Number of latest sessions to keep. Must cover the longest lookback of the rules.
+            By default, keep the full history.
+        """
+        self.n_subjects = len(metrics_list)
+        self._keys = list(metrics_list[0].keys()) if metrics_list else []
+        for key in self._keys:
+            values = [metrics[key] for metrics in metrics_list]
+            if np.ndim(values[0]) == 0:
+                setattr(self, key, np.asarray(values))
+                continue
+
+            values = [np.asarray(v, dtype=float) for v in values]
+            width = window or max(len(v) for v in values)
+            matrix = np.zeros((self.n_subjects, width))
+            valid = np.zeros((self.n_subjects, width), dtype=bool)
+            for i, v in enumerate(values):
+                v = v[-width:]
+                if len(v):
+                    matrix[i, -len(v):] = v
+                    valid[i, -len(v):] = True
+            setattr(self, key, HistoryMatrix(matrix, valid))
+
+    def subject(self, i: int) -> dict:
+        """ Metrics of the {i}-th subject (histories truncated to the window) """
+        metrics = {}
+        for key in self._keys:
+            value = getattr(self, key)
+            metrics[key] = (value.values[i][value.valid[i]] if isinstance(value, HistoryMatrix)
+                            else value[i])
+        return metrics
+
+
+class _Vectorizer(ast.NodeTransformer):
+    """ Turn Python boolean logic into element-wise NumPy logic """
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return result
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        # a < b < c --> (a < b) & (b < c)
+        lefts = [node.left] + node.comparators[:-1]
+        result = None
+        for left, op, right in zip(lefts, node.ops, node.comparators):
+            compare = ast.Compare(left=left, ops=[op], comparators=[right])
+            result = compare if result is None else ast.BinOp(left=result, op=ast.BitAnd(),
+                                                              right=compare)
+        return result
+
+    def visit_IfExp(self, node):
+        raise ValueError('Conditional expressions are not supported in vectorized conditions')
+
+
+def vectorize_condition(condition: str):
+    """ Compile a condition string into a function of MetricsBatch that returns a boolean array """
+    tree = ast.parse(condition.replace("\n", " ").strip(), mode='eval')
+    tree = ast.fix_missing_locations(_Vectorizer().visit(tree))
+    return eval(compile(tree, '<vectorized condition>', 'eval'), {'np': np})
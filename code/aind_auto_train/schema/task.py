@@ -44,6 +44,13 @@ class Metrics(BaseModel):
     session_total: int
     session_at_current_stage: int
 
+    @classmethod
+    def from_history(cls, **metrics):
+        """ Create metrics from trusted history without validation,
+        so that the history could be (zero-copy) NumPy arrays instead of lists
+        """
+        return cls.model_construct(**metrics)
+
 # Metrics class in Curriculum must be a subclass of Metrics
 metrics_class = TypeVar('metrics_class', bound=Metrics)
 
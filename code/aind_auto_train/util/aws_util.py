@@ -1,16 +1,55 @@
 import os
+import json
+import time
+import hashlib
+import fnmatch
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import configparser
 
+import numpy as np
 import pandas as pd
-import s3fs
 
 
 logger = logging.getLogger(__name__)
 
-# Setup s3fs filesystem
-# Using anon=False will automatically check for credential files, environment variables, and iam roles.
-fs = s3fs.S3FileSystem(anon=False)
+# Manifest of a table stored as partitions (see import_partitioned_df_from_s3)
+PARTITION_MANIFEST_NAME = 'manifest.json'
+
+# Size of the connection pool of the shared s3fs filesystem (botocore's default is 10),
+# large enough for the thread pools of the transfers below
+S3_MAX_POOL_CONNECTIONS = 32
+
+_fs = None
+_fs_lock = threading.Lock()
+
+
+def get_fs():
+    """ The s3fs filesystem shared by the whole process, created on first use (None if it can't be created)
+
+    Using anon=False will automatically check for credential files, environment variables, and iam roles.
+    """
+    global _fs
+    if _fs is None:
+        with _fs_lock:
+            if _fs is None:
+                try:
+                    import s3fs
+                    _fs = s3fs.S3FileSystem(
+                        anon=False,
+                        config_kwargs=dict(max_pool_connections=S3_MAX_POOL_CONNECTIONS))
+                except Exception as e:
+                    logger.error(f'Error connecting to AWS S3: {e}')
+    return _fs
+
+
+def set_fs(fs):
+    """ Use {fs} as the shared filesystem (e.g. a local fsspec filesystem in tests); None to reset """
+    global _fs
+    with _fs_lock:
+        _fs = fs
+
 
 # Function to export DataFrame to S3
 def export_df_to_s3(df,
@@ -18,38 +57,124 @@ def export_df_to_s3(df,
                     bucket='aind-behavior-data',
                     s3_path='foraging_auto_training/'
                     ):
+    fs = get_fs()
     if fs is None:
         logger.error(f'AWS S3 not connected!')
         return None
 
     try:
         s3_file_path = f"{bucket}/{s3_path}{file_name}"
+        # (Closing the file completes the upload)
         if file_name.endswith('.pkl'):
-            df.to_pickle(fs.open(s3_file_path, 'wb'))
+            with fs.open(s3_file_path, 'wb') as f:
+                df.to_pickle(f)
         elif file_name.endswith('.csv'):
-            df.to_csv(fs.open(s3_file_path, 'w'))
+            with fs.open(s3_file_path, 'w') as f:
+                df.to_csv(f)
+        elif file_name.endswith('.parquet'):
+            with fs.open(s3_file_path, 'wb') as f:
+                df.to_parquet(f)
 
         logger.info(f'Dataframe exported to s3://{s3_file_path}, '
                     f'len(df) = {len(df)}')
+        return True
     except OSError as e:
         logger.error(f'Error writing file to S3: {e}')
+        return None
 
 
-def import_df_from_s3(file_name,
+def export_json_to_s3(obj,
+                      file_name,
                       bucket='aind-behavior-data',
                       s3_path='foraging_auto_training/'
                       ):
+    fs = get_fs()
+    if fs is None:
+        logger.error(f'AWS S3 not connected!')
+        return None
+
+    s3_file_path = f"{bucket}/{s3_path}{file_name}"
+    try:
+        with fs.open(s3_file_path, 'w') as f:
+            json.dump(obj, f, indent=4)
+        return True
+    except OSError as e:
+        logger.error(f'Error writing file to S3: {e}')
+        return None
+
 
+def import_json_from_s3(file_name,
+                        bucket='aind-behavior-data',
+                        s3_path='foraging_auto_training/'
+                        ):
+    fs = get_fs()
     if fs is None:
         logger.error(f'AWS S3 not connected!')
         return None
 
     s3_file_path = f"{bucket}/{s3_path}{file_name}"
     try:
-        if file_name.endswith('.pkl'):
-            df = pd.read_pickle(fs.open(s3_file_path, 'rb'))
-        elif file_name.endswith('.csv'):
-            df = pd.read_csv(fs.open(s3_file_path))
+        with fs.open(s3_file_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.info(f'File not found: s3://{s3_file_path}')
+        return None
+    except OSError as e:
+        logger.error(f'Error reading file from S3: {e}')
+        return None
+
+
+def delete_files_on_s3(file_names,
+                       bucket='aind-behavior-data',
+                       s3_path='foraging_auto_training/'
+                       ):
+    fs = get_fs()
+    if fs is None:
+        logger.error(f'AWS S3 not connected!')
+        return None
+
+    if not file_names:
+        return
+    try:
+        fs.rm([f"{bucket}/{s3_path}{file_name}" for file_name in file_names])
+        logger.info(f'{len(file_names)} files deleted from s3://{bucket}/{s3_path}')
+    except OSError as e:
+        logger.error(f'Error deleting files on S3: {e}')
+
+
+def import_df_from_s3(file_name,
+                      bucket='aind-behavior-data',
+                      s3_path='foraging_auto_training/',
+                      columns=None,
+                      filters=None,
+                      cache_dir=None,
+                      ):
+    """
+    Import a DataFrame from S3 (.pkl, .csv or .parquet)
+
+    For Parquet files only:
+    columns: list of str
+        Only read these columns (columns not in the file are ignored). The index is always read.
+    filters: list of tuples
+        Row filters like [('session_date', '>=', '2024-01-01')], which skip
+        the row groups that can't match (see pyarrow.parquet.read_table)
+
+    cache_dir: str
+        If set, the table is cached in {cache_dir} and only downloaded again if its ETag
+        has changed (one HEAD request otherwise). Cached tables are stored as Arrow IPC files
+        and memory-mapped when read, if possible.
+    """
+    fs = get_fs()
+    if fs is None:
+        logger.error(f'AWS S3 not connected!')
+        return None
+
+    s3_file_path = f"{bucket}/{s3_path}{file_name}"
+    try:
+        if cache_dir is not None:
+            df = _import_df_with_local_cache(s3_file_path, cache_dir, columns, filters)
+        else:
+            df = _read_df(s3_file_path, columns, filters)
         logger.info(f'Dataframe imported from s3://{s3_file_path}, '
                     f'len(df) = {len(df)}')
         return df
@@ -61,47 +186,471 @@ def import_df_from_s3(file_name,
         return None
 
 
+def import_partitioned_df_from_s3(s3_path,
+                                  bucket='aind-behavior-data',
+                                  cache_dir=None,
+                                  return_manifest=False,
+                                  ):
+    """
+    Import a DataFrame stored as partitions under s3://{bucket}/{s3_path}, reassembled from the
+    partitions listed in its manifest.json ({'parts': [{'file_name': ...}, ...], ...})
+
+    Returns None if there is no manifest (no table yet), or (df, manifest) if {return_manifest}.
+    Unlike import_df_from_s3(), raises if the manifest or one of its partitions can't be read,
+    so that a transient error is never mistaken for a missing table.
+
+    cache_dir: str
+        If set, the partitions (which never change) are cached locally (see import_df_from_s3)
+    """
+    fs = get_fs()
+    if fs is None:
+        raise OSError('AWS S3 not connected!')
+
+    s3_dir_path = f"{bucket}/{s3_path}"
+    try:
+        with fs.open(s3_dir_path + PARTITION_MANIFEST_NAME, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        logger.info(f'No partitioned table at s3://{s3_dir_path}')
+        return None
+
+    dfs = []
+    for part in manifest['parts']:
+        s3_file_path = s3_dir_path + part['file_name']
+        try:
+            dfs.append(_import_df_with_local_cache(s3_file_path, cache_dir) if cache_dir is not None
+                       else _read_df(s3_file_path))
+        except FileNotFoundError:
+            raise FileNotFoundError(f'Partition s3://{s3_file_path} listed in the manifest is missing')
+    df = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+    logger.info(f'Dataframe imported from {len(dfs)} partitions in s3://{s3_dir_path}, '
+                f'len(df) = {manifest["n_rows"]}')
+    return (df, manifest) if return_manifest else df
+
+
+def _read_df(s3_file_path, columns=None, filters=None) -> pd.DataFrame:
+    fs = get_fs()
+    if s3_file_path.endswith('.pkl'):
+        return pd.read_pickle(fs.open(s3_file_path, 'rb'))
+    elif s3_file_path.endswith('.csv'):
+        return pd.read_csv(fs.open(s3_file_path))
+    elif s3_file_path.endswith('.parquet'):
+        with fs.open(s3_file_path, 'rb') as f:
+            return _read_parquet(f, columns=columns, filters=filters)
+
+
+def _read_parquet(f, columns=None, filters=None) -> pd.DataFrame:
+    import pyarrow.parquet as pq  # Only required for Parquet tables
+
+    if columns is not None:
+        names = pq.read_schema(f).names
+        columns = [col for col in columns if col in names]
+        f.seek(0)
+    return pq.read_table(f, columns=columns, filters=filters,
+                         use_pandas_metadata=True).to_pandas()
+
+
+def _get_etag(info: dict) -> str:
+    """ ETag of an object (or its mtime if the filesystem has no ETag) """
+    return info.get('ETag') or str(info.get('mtime'))
+
+
+def _import_df_with_local_cache(s3_file_path, cache_dir, columns=None, filters=None) -> pd.DataFrame:
+    """ Read a table from the local cache if its ETag on S3 is unchanged, otherwise download and cache it
+    """
+    fs = get_fs()
+    etag = _get_etag(fs.info(s3_file_path, refresh=True))  # HEAD request only
+
+    # One entry per table and columns. The filters (e.g. a moving high-water mark) are not in the key,
+    # so that reading with new filters replaces the entry instead of adding one
+    key = hashlib.md5(json.dumps([s3_file_path, columns], default=str).encode()).hexdigest()
+    meta_file = os.path.join(cache_dir, f'{key}.json')
+    filters_json = json.dumps(filters, default=str)
+    try:
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        meta = {}
+
+    if meta.get('etag') == etag and meta.get('filters') == filters_json:
+        try:
+            df = _read_local_table(os.path.join(cache_dir, meta['file_name']))
+            logger.info(f'Dataframe of s3://{s3_file_path} unchanged, read from {cache_dir}')
+            return df
+        except (OSError, ValueError) as e:
+            logger.warning(f'Error reading cached s3://{s3_file_path}: {e}')
+
+    df = _read_df(s3_file_path, columns, filters)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    file_name = _write_local_table(df, os.path.join(cache_dir, key))
+    with open(meta_file, 'w') as f:
+        json.dump(dict(s3_file_path=s3_file_path, etag=etag, filters=filters_json,
+                       file_name=file_name), f, indent=4)
+    # The previous version of the entry may have been in another format
+    if meta.get('file_name') not in (None, file_name):
+        try:
+            os.remove(os.path.join(cache_dir, meta['file_name']))
+        except OSError:
+            pass
+    return df
+
+
+def _is_arrow_compatible(df: pd.DataFrame) -> bool:
+    """ Whether {df} survives a round trip through Arrow unchanged
+    (flat string column names, and no lists or dicts in object columns)
+    """
+    if df.columns.nlevels > 1 or not all(isinstance(col, str) for col in df.columns):
+        return False
+    for col in df.columns:
+        if df[col].dtype == object:
+            values = df[col].dropna()
+            if len(values) and isinstance(values.iloc[0], (list, dict, tuple, np.ndarray)):
+                return False
+    return True
+
+
+def _write_local_table(df: pd.DataFrame, path_no_ext: str) -> str:
+    """ Write {df} to the local cache as an Arrow IPC file if possible, otherwise as a pickle
+    Returns the file name
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
+
+    if pa is not None and _is_arrow_compatible(df):
+        try:
+            table = pa.Table.from_pandas(df)
+            with pa.OSFile(path_no_ext + '.arrow.tmp', 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(path_no_ext + '.arrow.tmp', path_no_ext + '.arrow')
+            return os.path.basename(path_no_ext) + '.arrow'
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            logger.debug(f'Could not cache the table in Arrow format ({e}), using pickle')
+
+    df.to_pickle(path_no_ext + '.pkl.tmp')
+    os.replace(path_no_ext + '.pkl.tmp', path_no_ext + '.pkl')
+    return os.path.basename(path_no_ext) + '.pkl'
+
+
+def _read_local_table(path: str) -> pd.DataFrame:
+    if path.endswith('.arrow'):
+        import pyarrow as pa
+        # Memory-map the file, so that (numeric) columns are backed by the mapped file
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all().to_pandas(split_blocks=True)
+    return pd.read_pickle(path)
+
+
+def glob_s3(pattern,
+            bucket='aind-behavior-data',
+            s3_path='foraging_auto_training/'
+            ):
+    """
+    List files matching {pattern} under s3://{bucket}/{s3_path}
+    Returns file names relative to s3_path (sorted)
+    """
+    fs = get_fs()
+    if fs is None:
+        logger.error(f'AWS S3 not connected!')
+        return None
+
+    s3_dir_path = f"{bucket}/{s3_path}"
+    return sorted(os.path.relpath(f, s3_dir_path)
+                  for f in fs.glob(s3_dir_path + pattern))
+
+
+def get_s3_fingerprint(s3_paths):
+    """
+    Fingerprint of files on s3 (paths as 'bucket/key'; directories end with '/',
+    glob patterns are allowed), from their ETags only (no download).
+    Changes when any of the files is added, changed or removed.
+    """
+    fs = get_fs()
+    if fs is None:
+        logger.error(f'AWS S3 not connected!')
+        return None
+
+    fingerprint = []
+    for s3_path in s3_paths:
+        fs.invalidate_cache(s3_path.split('*')[0].rstrip('/'))
+        try:
+            if s3_path.endswith('/') or '*' in s3_path:
+                files = (fs.find(s3_path.rstrip('/'), detail=True) if s3_path.endswith('/')
+                         else fs.glob(s3_path, detail=True))
+                fingerprint.append(tuple(sorted((path, _get_etag(info))
+                                                for path, info in files.items())))
+            else:
+                fingerprint.append(_get_etag(fs.info(s3_path)))
+        except FileNotFoundError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+
+def _is_included(path, include=None, exclude=None) -> bool:
+    """ Whether the file name of {path} matches any fnmatch pattern in {include} (if given)
+    and none in {exclude} """
+    file_name = os.path.basename(path)
+    if include and not any(fnmatch.fnmatch(file_name, pattern) for pattern in include):
+        return False
+    return not (exclude and any(fnmatch.fnmatch(file_name, pattern) for pattern in exclude))
+
+
+def _transfer_files(transfers, transfer_func, max_workers=8):
+    """
+    Run transfer_func(src, dst) for each (src, dst, size) in {transfers} in a thread pool
+
+    Returns a summary dict with the number of objects and bytes transferred, the wall time,
+    the time of each object and the failed objects
+    """
+    def _transfer(src, dst):
+        start = time.time()
+        transfer_func(src, dst)
+        return time.time() - start
+
+    summary = dict(objects=0, bytes=0, wall_time=0.0, object_times={}, failed=[])
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_transfer, src, dst): (src, dst, size)
+                   for src, dst, size in transfers}
+        for future, (src, dst, size) in futures.items():
+            try:
+                summary['object_times'][src] = future.result()
+            except Exception as e:  # One failed object should not abort the others
+                logger.error(f'Error transferring {src} to {dst}: {e}')
+                summary['failed'].append(src)
+                continue
+            logger.debug(f'{src} --> {dst}: {size} bytes in '
+                         f'{summary["object_times"][src]:.3f} s')
+            summary['objects'] += 1
+            summary['bytes'] += size
+    summary['wall_time'] = time.time() - start
+    return summary
+
+
 def download_dir_from_s3(bucket='aind-behavior-data',
                          s3_dir='foraging_auto_training/saved_curriculums/',
                          local_dir='/root/capsule/scratch/saved_curriculums/',
+                         max_workers=8,
                          ):
     """
-    Copy a directory from S3 to local
+    Copy a directory from S3 to local, with {max_workers} concurrent object transfers
+
+    Returns a summary of the transfers (see _transfer_files)
     """
+    fs = get_fs()
     if fs is None:
         logger.error(f'AWS S3 not connected!')
         return None
     
-    s3_dir_path = f"{bucket}/{s3_dir}"
+    s3_dir_path = f"{bucket}/{s3_dir}".rstrip('/')
     try:
-        res = fs.get(s3_dir_path, local_dir, recursive=True)
-        logger.info(f'{len(res)-2} objects downloaded from s3://{s3_dir_path} '
-                    f'to {local_dir}')
+        remote_files = fs.find(s3_dir_path, detail=True)
     except FileNotFoundError:
         logger.error(f'Directory not found: s3://{s3_dir_path}')
         return None
+    if not remote_files:
+        logger.error(f'Directory not found: s3://{s3_dir_path}')
+        return None
 
+    transfers = []
+    for remote_path, info in remote_files.items():
+        local_path = os.path.join(local_dir, os.path.relpath(remote_path, s3_dir_path))
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        transfers.append((remote_path, local_path, info.get('size') or 0))
 
-def upload_dir_to_s3(local_dir='/root/capsule/scratch/saved_curriculums/',
-                     bucket='aind-behavior-data',
+    summary = _transfer_files(transfers, fs.get_file, max_workers)
+    logger.info(f'{summary["objects"]} objects ({summary["bytes"]} bytes) downloaded '
+                f'from s3://{s3_dir_path} to {local_dir} in {summary["wall_time"]:.2f} s')
+    return summary
+
+
+def sync_dir_from_s3(bucket='aind-behavior-data',
                      s3_dir='foraging_auto_training/saved_curriculums/',
+                     local_dir='/root/capsule/scratch/saved_curriculums/',
+                     include=None,
+                     state_file=None,
+                     max_workers=8,
+                     exclude=None,
                      ):
     """
-    Copy a directory from local to S3
+    Incrementally copy a directory from S3 to local
+
+    Only objects that are new or whose ETag or size has changed since the last sync
+    (or whose local copy is missing) are downloaded.
+
+    include: list of str
+        fnmatch patterns of the file names to sync (e.g. ['*.json']). By default, sync all files.
+    exclude: list of str
+        fnmatch patterns of the file names not to sync (applied after include).
+    state_file: str
+        Json file that records the ETag and size of the synced objects.
+        By default, '{local_dir}_s3_sync_state.json' (next to, not inside, local_dir).
+    max_workers: int
+        Number of concurrent object transfers
+
+    Returns the list of downloaded files (relative to local_dir)
     """
+    fs = get_fs()
     if fs is None:
         logger.error(f'AWS S3 not connected!')
         return None
 
-    s3_dir_path = f"{bucket}/{s3_dir}"
+    s3_dir_path = f"{bucket}/{s3_dir}".rstrip('/')
+    state_file = state_file or local_dir.rstrip('/') + '_s3_sync_state.json'
     try:
-        res = fs.put(local_dir, s3_dir_path, recursive=True)
-        logger.info(f'{len(res)} objects uploaded from {local_dir} '
-                    f'to s3://{s3_dir_path} ')
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+
+    try:
+        remote_files = fs.find(s3_dir_path, detail=True)
     except FileNotFoundError:
+        logger.error(f'Directory not found: s3://{s3_dir_path}')
+        return None
+
+    transfers = []
+    for remote_path, info in remote_files.items():
+        rel_path = os.path.relpath(remote_path, s3_dir_path)
+        if not _is_included(rel_path, include, exclude):
+            continue
+
+        remote_state = dict(etag=_get_etag(info),
+                            size=info.get('size'))
+        local_path = os.path.join(local_dir, rel_path)
+        if state.get(rel_path) == remote_state and os.path.exists(local_path) \
+                and os.path.getsize(local_path) == remote_state['size']:
+            continue
+
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        transfers.append((remote_path, local_path, remote_state['size'] or 0))
+        state[rel_path] = remote_state
+
+    summary = _transfer_files(transfers, fs.get_file, max_workers)
+    for remote_path in summary['failed']:
+        state.pop(os.path.relpath(remote_path, s3_dir_path))
+    downloaded = [os.path.relpath(remote_path, s3_dir_path)
+                  for remote_path in summary['object_times']]
+
+    if downloaded:
+        with open(state_file, 'w') as f:
+            json.dump(state, f, indent=4)
+
+    logger.info(f'{len(downloaded)} objects downloaded from s3://{s3_dir_path} '
+                f'to {local_dir} ({len(remote_files) - len(downloaded)} skipped)')
+    return downloaded
+
+
+def _is_copy_up_to_date(src_info: dict, dst_info: dict) -> bool:
+    """ Whether the object {dst_info} is an up-to-date copy of {src_info} (infos from fs.find) """
+    if dst_info.get('size') != src_info.get('size'):
+        return False
+    src_etag = _get_etag(src_info)
+    if _get_etag(dst_info) == src_etag:
+        return True
+    # A copy of a single-part object keeps its ETag, but a multipart ETag ('<md5>-<n parts>')
+    # is replaced by the ETag of the copy
+    if '-' in src_etag.strip('"'):
+        src_time = src_info.get('LastModified') or src_info.get('mtime')
+        dst_time = dst_info.get('LastModified') or dst_info.get('mtime')
+        return src_time is not None and dst_time is not None and dst_time >= src_time
+    return False
+
+
+def sync_dir_on_s3(src_dir_path, dst_dir_path, max_workers=16):
+    """
+    Incrementally mirror an S3 directory to another one (both as "bucket/prefix")
+
+    Only objects that are missing in the destination or whose ETag or size differs are copied,
+    with {max_workers} concurrent server-side copies. Objects only in the destination are kept.
+    Objects uploaded in multiple parts get a new ETag when copied, so they are compared by size
+    and by their last modified time instead (the copy is up to date if it is not older).
+
+    Returns a summary of the copies (see _transfer_files), plus the number of unchanged objects
+    """
+    fs = get_fs()
+    if fs is None:
+        logger.error(f'AWS S3 not connected!')
+        return None
+
+    src_dir_path, dst_dir_path = src_dir_path.rstrip('/'), dst_dir_path.rstrip('/')
+    listings = []
+    for dir_path in (src_dir_path, dst_dir_path):
+        fs.invalidate_cache(dir_path)  # Always list the current objects
+        try:
+            files = fs.find(dir_path, detail=True)
+        except FileNotFoundError:
+            files = {}
+        # Skip placeholder "folders" and the prefix itself
+        listings.append({os.path.relpath(path, dir_path): info for path, info in files.items()
+                         if not path.endswith('/') and info.get('type') != 'directory'
+                         and os.path.relpath(path, dir_path) not in ('.', '')})
+    src_files, dst_files = listings
+    if not src_files:
+        logger.error(f'Directory not found: s3://{src_dir_path}')
+        return None
+
+    transfers, unchanged = [], 0
+    for rel_path, info in src_files.items():
+        dst_info = dst_files.get(rel_path)
+        if dst_info is not None and _is_copy_up_to_date(info, dst_info):
+            unchanged += 1
+            continue
+        transfers.append((f"{src_dir_path}/{rel_path}", f"{dst_dir_path}/{rel_path}",
+                          info.get('size') or 0))
+
+    summary = _transfer_files(transfers, fs.cp_file, max_workers)
+    summary['unchanged'] = unchanged
+    logger.info(f'{summary["objects"]} objects ({summary["bytes"]} bytes) copied '
+                f'from s3://{src_dir_path} to s3://{dst_dir_path} in {summary["wall_time"]:.2f} s '
+                f'({unchanged} unchanged, {len(summary["failed"])} failed)')
+    return summary
+
+
+def upload_dir_to_s3(local_dir='/root/capsule/scratch/saved_curriculums/',
+                     bucket='aind-behavior-data',
+                     s3_dir='foraging_auto_training/saved_curriculums/',
+                     max_workers=8,
+                     include=None,
+                     exclude=None,
+                     ):
+    """
+    Copy a directory from local to S3, with {max_workers} concurrent object transfers
+
+    include: list of str
+        fnmatch patterns of the file names to upload. By default, upload all files.
+    exclude: list of str
+        fnmatch patterns of the file names not to upload (applied after include).
+
+    Returns a summary of the transfers (see _transfer_files)
+    """
+    fs = get_fs()
+    if fs is None:
+        logger.error(f'AWS S3 not connected!')
+        return None
+
+    if not os.path.isdir(local_dir):
         logger.error(f'Directory not found: {local_dir}')
         return None
 
+    s3_dir_path = f"{bucket}/{s3_dir}".rstrip('/')
+    transfers = []
+    for root, _, files in os.walk(local_dir):
+        for file in files:
+            local_path = os.path.join(root, file)
+            rel_path = os.path.relpath(local_path, local_dir).replace(os.sep, '/')
+            if not _is_included(rel_path, include, exclude):
+                continue
+            transfers.append((local_path, f'{s3_dir_path}/{rel_path}',
+                              os.path.getsize(local_path)))
+
+    summary = _transfer_files(transfers, fs.put_file, max_workers)
+    logger.info(f'{summary["objects"]} objects ({summary["bytes"]} bytes) uploaded '
+                f'from {local_dir} to s3://{s3_dir_path} in {summary["wall_time"]:.2f} s')
+    return summary
+
 
 if __name__ == '__main__':
     logger.addHandler(logging.StreamHandler())
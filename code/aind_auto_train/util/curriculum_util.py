@@ -0,0 +1,157 @@
+"""
+Manifest and bundle of the saved curriculum json files
+
+The manifest is a small json file next to the curriculums that records, for each curriculum file,
+the name, versions, description, content hash and size, so that the catalog of curriculums
+can be listed without opening every curriculum json.
+
+The bundle is a single zip archive of all curriculum jsons and the manifest, so that a fresh
+worker gets all curriculums with one download. The zip index allows reading one curriculum
+without extracting the others.
+"""
+import os
+import re
+import json
+import zipfile
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = 'curriculum_manifest.json'
+BUNDLE_FILE_NAME = 'curriculum_bundle.zip'
+CURRICULUM_FILE_PATTERN = re.compile(r'(.+)_curriculum_v(.+)_schema_v(.+)\.json')
+
+
+def manifest_entry(json_file: str, content: bytes = None) -> dict:
+    """ Build the manifest entry of a curriculum json file (None if the file name can't be parsed)
+    """
+    match = CURRICULUM_FILE_PATTERN.search(os.path.basename(json_file))
+    if match is None:
+        logger.warning(
+            f"Could not parse {os.path.basename(json_file)} as a curriculum json file.")
+        return None
+    curriculum_name, curriculum_version, curriculum_schema_version = match.groups()
+
+    if content is None:
+        with open(json_file, 'rb') as f:
+            content = f.read()
+
+    entry = dict(curriculum_name=curriculum_name,
+                 curriculum_version=curriculum_version,
+                 curriculum_schema_version=curriculum_schema_version,
+                 curriculum_description=json.loads(content)['curriculum_description'],
+                 md5=hashlib.md5(content).hexdigest(),
+                 size=len(content),
+                 )
+    # The modification time tells sync_manifest() whether the file has been edited since
+    if os.path.exists(json_file):
+        entry['mtime_ns'] = os.stat(json_file).st_mtime_ns
+    return entry
+
+
+def load_manifest(local_dir: str) -> dict:
+    """ Load the manifest {json file name: entry} from {local_dir} (empty if not found) """
+    try:
+        with open(os.path.join(local_dir, MANIFEST_FILE_NAME), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(local_dir: str, manifest: dict):
+    with open(os.path.join(local_dir, MANIFEST_FILE_NAME), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+
+def update_manifest(local_dir: str, json_files: list, contents: list = None) -> dict:
+    """ Add (or refresh) the entries of {json_files} in the manifest of {local_dir} """
+    manifest = load_manifest(local_dir)
+    for i, json_file in enumerate(json_files):
+        entry = manifest_entry(json_file, contents[i] if contents else None)
+        if entry is not None:
+            manifest[os.path.basename(json_file)] = entry
+    save_manifest(local_dir, manifest)
+    return manifest
+
+
+def sync_manifest(local_dir: str, json_files: list) -> dict:
+    """ Make the manifest of {local_dir} match {json_files}
+
+    Only files that are new or whose size or modification time has changed are read;
+    entries of removed files are dropped.
+    The manifest is only rewritten if something changed.
+    """
+    manifest = load_manifest(local_dir)
+    synced = {}
+    for json_file in json_files:
+        file_name = os.path.basename(json_file)
+        entry = manifest.get(file_name)
+        stat = os.stat(json_file)
+        if (entry is None or entry['size'] != stat.st_size
+                or entry.get('mtime_ns') != stat.st_mtime_ns):
+            entry = manifest_entry(json_file)
+            if entry is None:
+                continue
+        synced[file_name] = entry
+
+    if synced != manifest:
+        logger.info(f"Updated {MANIFEST_FILE_NAME} in {local_dir} ({len(synced)} curriculums)")
+        save_manifest(local_dir, synced)
+    return synced
+
+
+def pack_bundle(local_dir: str, json_files: list, manifest: dict) -> str:
+    """ Pack {json_files} and their {manifest} into the bundle in {local_dir} """
+    f_name = os.path.join(local_dir, BUNDLE_FILE_NAME)
+    with zipfile.ZipFile(f_name + '.tmp', 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr(MANIFEST_FILE_NAME, json.dumps(manifest, indent=4))
+        for json_file in json_files:
+            bundle.write(json_file, arcname=os.path.basename(json_file))
+    os.replace(f_name + '.tmp', f_name)  # So that readers never see a partial bundle
+    logger.info(f"Packed {len(json_files)} curriculums into {f_name}")
+    return f_name
+
+
+class CurriculumBundle:
+    """ Read-only access to a curriculum bundle, opening curriculums lazily
+    """
+
+    def __init__(self, f_name: str):
+        self.f_name = f_name
+        self._zip = zipfile.ZipFile(f_name, 'r')
+        self.manifest = json.loads(self._zip.read(MANIFEST_FILE_NAME))
+
+    # Reopen the file after pickling (e.g., when sent to worker processes)
+    def __getstate__(self):
+        return {'f_name': self.f_name}
+
+    def __setstate__(self, state):
+        self.__init__(state['f_name'])
+
+    def names(self) -> list:
+        """ File names of the curriculum jsons in the bundle """
+        return [name for name in self._zip.namelist() if name != MANIFEST_FILE_NAME]
+
+    def read(self, json_name: str) -> bytes:
+        """ Content of one curriculum json (FileNotFoundError if not in the bundle) """
+        try:
+            return self._zip.read(json_name)
+        except KeyError:
+            raise FileNotFoundError(f"{json_name} not found in {self.f_name}")
+
+    def extract(self, local_dir: str, overwrite: bool = False) -> list:
+        """ Write the curriculum jsons of the bundle to {local_dir}
+        (keeping the local files unless {overwrite}). Returns the written files """
+        written = []
+        for json_name in self.names():
+            f_name = os.path.join(local_dir, json_name)
+            if os.path.exists(f_name) and not overwrite:
+                continue
+            with open(f_name, 'wb') as f:
+                f.write(self.read(json_name))
+            written.append(f_name)
+        return written
+
+    def close(self):
+        self._zip.close()
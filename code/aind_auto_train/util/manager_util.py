@@ -0,0 +1,294 @@
+"""
+Helpers for AutoTrainManager to avoid rebuilding the full tables on every session
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+def _intern(value):
+    """ Intern strings (and string keys of dicts) so that equal values are the same object """
+    if type(value) is str:
+        return sys.intern(value)
+    if type(value) is dict:
+        return {_intern(key): item for key, item in value.items()}
+    return value
+
+
+class RowBuffer:
+    """ Columnar append buffer for new df_manager rows
+
+    Appending a row only appends to per-column lists, so that the rows can be
+    materialised into a DataFrame once instead of one pd.concat per session.
+    Strings are interned, so that repeated values (stages, curriculum names, etc.)
+    are shared no matter which process the rows come from.
+    """
+
+    def __init__(self):
+        self._columns = {}  # column name -> list of values
+        self._n_rows = 0
+
+    def __len__(self):
+        return self._n_rows
+
+    def append(self, row: dict):
+        # New columns are back-filled with None for the rows already buffered
+        for key in row:
+            if key not in self._columns:
+                self._columns[key] = [None] * self._n_rows
+        for key, values in self._columns.items():
+            values.append(_intern(row.get(key)))
+        self._n_rows += 1
+
+    def extend(self, rows: list):
+        for row in rows:
+            self.append(row)
+
+    def row(self, i: int) -> dict:
+        """ Return the {i}-th buffered row as a dict """
+        return {col: values[i] for col, values in self._columns.items()}
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self._columns)
+
+    def clear(self):
+        self._columns = {}
+        self._n_rows = 0
+
+
+class SessionIndex:
+    """ Index of a table by subject_id and (subject_id, session)
+
+    Maps subject_id to the row positions of that subject and (subject_id, session)
+    to the position of its first row, so that lookups are O(1) instead of a
+    DataFrame.query() over the full table.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self._subject_ids)
+
+    def clear(self):
+        self._subject_ids = []  # Indexed keys, to detect appended rows in update()
+        self._sessions = []
+        self._subject_rows = {}  # subject_id -> list of row positions
+        self._session_row = {}  # (subject_id, session) -> row position
+        self._keys = None  # Cached MultiIndex of all (subject_id, session), see isin()
+
+    def append(self, subject_id, session):
+        """ Index a new row appended to the end of the table """
+        position = len(self._subject_ids)
+        self._subject_ids.append(subject_id)
+        self._sessions.append(session)
+        self._subject_rows.setdefault(subject_id, []).append(position)
+        self._session_row.setdefault((subject_id, session), position)
+        self._keys = None
+
+    def update(self, df: pd.DataFrame):
+        """ Sync the index with {df}
+
+        If {df} only has new rows appended to the indexed ones, only the new rows are indexed.
+        Otherwise, the index is rebuilt.
+        """
+        if df is None or not len(df):
+            self.clear()
+            return
+
+        subject_ids = df['subject_id'].to_list()
+        sessions = df['session'].to_list()
+        n_indexed = len(self)
+        if not (len(df) >= n_indexed
+                and subject_ids[:n_indexed] == self._subject_ids
+                and sessions[:n_indexed] == self._sessions):
+            self.clear()
+            n_indexed = 0
+
+        for subject_id, session in zip(subject_ids[n_indexed:], sessions[n_indexed:]):
+            self.append(subject_id, session)
+
+    def rows(self, subject_id) -> list:
+        """ Row positions of {subject_id} (in table order) """
+        return self._subject_rows.get(subject_id, [])
+
+    def isin(self, df: pd.DataFrame) -> np.ndarray:
+        """ Whether each (subject_id, session) of {df} is in the index (vectorized) """
+        if self._keys is None:
+            self._keys = pd.MultiIndex.from_arrays([self._subject_ids, self._sessions])
+        return pd.MultiIndex.from_arrays([df['subject_id'], df['session']]).isin(self._keys)
+
+    def position(self, subject_id, session):
+        """ Position of the first row of ({subject_id}, {session}), or None if not found """
+        return self._session_row.get((subject_id, session))
+
+
+class SubjectState:
+    """ Compact training state of one subject, updated in O(1) per evaluated session
+
+    last_stage: current_stage_actual of the last row in df_manager
+    run_length: number of trailing rows at last_stage
+    last_session: the largest session number in df_manager
+    last_next_stage_suggested: next_stage_suggested of (the first row of) last_session
+    n_rows: number of rows of this subject in df_manager
+    """
+    __slots__ = ('last_stage', 'run_length', 'last_session',
+                 'last_next_stage_suggested', 'n_rows')
+
+    def __init__(self, last_stage=None, run_length=0, last_session=None,
+                 last_next_stage_suggested=None, n_rows=0):
+        self.last_stage = last_stage
+        self.run_length = run_length
+        self.last_session = last_session
+        self.last_next_stage_suggested = last_next_stage_suggested
+        self.n_rows = n_rows
+
+    def advance(self, current_stage_actual, session, next_stage_suggested):
+        """ Update the state with a new row of df_manager """
+        if self.n_rows and current_stage_actual == self.last_stage:
+            self.run_length += 1
+        else:
+            self.last_stage = current_stage_actual
+            self.run_length = 1
+
+        if self.last_session is None or session > self.last_session:
+            self.last_session = session
+            self.last_next_stage_suggested = next_stage_suggested
+
+        self.n_rows += 1
+
+    def count_session_at_current_stage(self, current_stage) -> int:
+        """ Count the number of sessions at the current stage (reset after rolling back) """
+        if self.n_rows and current_stage == self.last_stage:
+            return self.run_length + 1
+        return 1
+
+
+def build_subject_states(df_manager: pd.DataFrame) -> dict:
+    """ Build {subject_id: SubjectState} with one pass over df_manager """
+    states = {}
+    if df_manager is None:
+        return states
+    for subject_id, current_stage_actual, session, next_stage_suggested in zip(
+            df_manager['subject_id'], df_manager['current_stage_actual'],
+            df_manager['session'], df_manager['next_stage_suggested']):
+        states.setdefault(subject_id, SubjectState()).advance(
+            current_stage_actual, session, next_stage_suggested)
+    return states
+
+
+def subject_states_to_df(states: dict) -> pd.DataFrame:
+    """ Turn {subject_id: SubjectState} into a table (one row per subject) """
+    return pd.DataFrame(
+        [(subject_id, *[_intern(getattr(state, slot)) for slot in SubjectState.__slots__])
+         for subject_id, state in states.items()],
+        columns=['subject_id', *SubjectState.__slots__])
+
+
+def subject_states_from_df(df_states: pd.DataFrame) -> dict:
+    """ Inverse of subject_states_to_df() """
+    return {record.pop('subject_id'): SubjectState(**record)
+            for record in df_states.to_dict(orient='records')}
+
+
+class MetricsHistory:
+    """ Metrics history of one subject as NumPy arrays sorted by session
+
+    The history up to a session is a prefix of these arrays, so each session gets
+    zero-copy views instead of rebuilding the lists from df_behavior.
+    """
+
+    def __init__(self, df_behavior_this: pd.DataFrame, keys):
+        df_behavior_this = df_behavior_this.sort_values(by=['session'], ascending=True)
+        self._sessions = df_behavior_this['session'].to_numpy()
+        self._arrays = {key: df_behavior_this[key].to_numpy() for key in keys}
+
+    def to_dict(self) -> dict:
+        """ The full history as lists, including the sessions """
+        return {'session': self._sessions.tolist(),
+                **{key: array.tolist() for key, array in self._arrays.items()}}
+
+    def up_to(self, session) -> dict:
+        """ Views of the metrics of all sessions <= {session} """
+        n_sessions = np.searchsorted(self._sessions, session, side='right')
+        return {key: array[:n_sessions] for key, array in self._arrays.items()}
+
+
+def _same_value(a, b) -> bool:
+    return a == b or (pd.isna(a) and pd.isna(b))
+
+
+def record_metrics_history(history: dict, metrics_history: MetricsHistory) -> int:
+    """ Record the current metrics of all sessions of {metrics_history} in {history}
+
+    history: {'session': [...], key: [...]} of one subject, appended in the order the sessions
+        arrived. A session whose metrics have changed upstream is appended again (a new version),
+        so the versions used by earlier evaluations are kept.
+    Returns the number of entries recorded so far, which the compact metrics store as 'n_arrived'
+    """
+    latest = {session: i for i, session in enumerate(history['session'])}
+    full = metrics_history.to_dict()
+    keys = [key for key in full if key != 'session']
+    for i, session in enumerate(full['session']):
+        if session in latest and all(_same_value(history[key][latest[session]], full[key][i])
+                                     for key in keys):
+            continue
+        for key, values in full.items():
+            history.setdefault(key, []).append(values[i])
+    return len(history['session'])
+
+
+def metrics_history_to_df(histories: dict) -> pd.DataFrame:
+    """ Turn {subject_id: history} (see record_metrics_history) into a table
+    (one row per subject, histories as lists)
+    """
+    return pd.DataFrame([{'subject_id': subject_id, **history}
+                         for subject_id, history in histories.items()])
+
+
+def metrics_history_from_df(df_metrics_history: pd.DataFrame) -> dict:
+    """ Inverse of metrics_history_to_df() """
+    if df_metrics_history is None:
+        return {}
+    return {record.pop('subject_id'): {key: list(values) for key, values in record.items()}
+            for record in df_metrics_history.to_dict(orient='records')}
+
+
+def expand_metrics(metrics: dict, history: dict) -> dict:
+    """ Rebuild the full metrics of a df_manager row from its compact metrics
+
+    metrics: compact metrics {'n_history': n, 'n_arrived': m, 'session_total': ...,
+                              'session_at_current_stage': ...}
+    history: the row of this subject in the metrics history table (see metrics_history_to_df)
+
+    The history used by the evaluation is the latest version of the sessions <= session_total
+    among the first n_arrived entries recorded, sorted by session.
+    """
+    if 'n_history' not in metrics:  # Already full
+        return metrics
+    keys = [key for key in history if key not in ('subject_id', 'session')]
+    if 'n_arrived' in metrics:
+        latest = {}
+        for i, session in enumerate(history['session'][:metrics['n_arrived']]):
+            if session <= metrics['session_total']:
+                latest[session] = i
+        values = {key: [history[key][latest[session]] for session in sorted(latest)]
+                  for key in keys}
+    else:  # Saved before n_arrived was recorded
+        values = {key: history[key][:metrics['n_history']] for key in keys}
+    return {**values,
+            'session_total': metrics['session_total'],
+            'session_at_current_stage': metrics['session_at_current_stage']}
+
+
+def expand_metrics_column(df_manager: pd.DataFrame, df_metrics_history: pd.DataFrame) -> pd.Series:
+    """ Full metrics of all rows of {df_manager} (for tables saved with compact metrics)
+
+    Usage: df_manager['metrics'] = expand_metrics_column(df_manager, df_metrics_history)
+    """
+    histories = {record['subject_id']: record
+                 for record in df_metrics_history.to_dict(orient='records')}
+    return pd.Series([expand_metrics(metrics, histories.get(subject_id, {}))
+                      for subject_id, metrics in zip(df_manager['subject_id'], df_manager['metrics'])],
+                     index=df_manager.index, name='metrics')
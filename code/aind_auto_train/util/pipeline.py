@@ -0,0 +1,79 @@
+"""
+Update several managers concurrently, overlapping the I/O of one manager with the computation of another
+
+Each manager goes through the three stages of AutoTrainManager.update():
+download --> evaluate --> upload. Downloads and uploads (s3fs calls) run in threads, so they overlap
+with the evaluation of other managers. Evaluations run one at a time, because they are CPU-bound.
+
+    manager A:  [download][evaluate][upload]
+    manager B:  [download]..........[evaluate][upload]
+"""
+import time
+import asyncio
+import logging
+import functools
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_stage(timing: dict, stage: str, func, *args, **kwargs):
+    """ Run a blocking stage in a thread and record its wall time in {timing} """
+    loop = asyncio.get_event_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    finally:
+        timing[stage] = time.perf_counter() - start
+
+
+async def _update_manager(manager_name, manager, evaluate_lock, timing, workers=None):
+    await _run_stage(timing, 'download', manager.update_download)
+
+    wait_start = time.perf_counter()
+    async with evaluate_lock:
+        timing['wait'] = time.perf_counter() - wait_start
+        await _run_stage(timing, 'evaluate', manager.update_evaluate, workers=workers)
+
+    await _run_stage(timing, 'upload', manager.update_upload)
+
+
+async def update_managers_async(managers: dict, workers: int = None) -> dict:
+    """ Update all {managers} ({name: AutoTrainManager}) with overlapped I/O and computation
+
+    workers: int
+        Passed to update_evaluate() of each manager.
+
+    Returns the wall time (s) of each stage of each manager, {name: {stage: seconds}},
+    where 'wait' is the time spent waiting for the evaluation of other managers.
+    A failed manager is logged and has its error in timing['error']; the others go on.
+    """
+    evaluate_lock = asyncio.Lock()
+    timings = {manager_name: {} for manager_name in managers}
+
+    async def _update(manager_name, manager):
+        start = time.perf_counter()
+        try:
+            await _update_manager(manager_name, manager, evaluate_lock, timings[manager_name],
+                                  workers=workers)
+        except Exception as e:
+            logger.error(f'Update of manager {manager_name} failed: {e}')
+            timings[manager_name]['error'] = repr(e)
+        timings[manager_name]['total'] = time.perf_counter() - start
+
+    await asyncio.gather(*[_update(manager_name, manager)
+                           for manager_name, manager in managers.items()])
+
+    for manager_name, timing in timings.items():
+        logger.info(f'Manager {manager_name}: ' + ', '.join(
+            f'{stage} {seconds:.2f} s' for stage, seconds in timing.items()
+            if not isinstance(seconds, str)))
+    return timings
+
+
+def update_managers(managers: dict, workers: int = None) -> dict:
+    """ Blocking version of update_managers_async() """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(update_managers_async(managers, workers=workers))
+    finally:
+        loop.close()
@@ -0,0 +1,108 @@
+"""
+Run updates when the inputs change, instead of at fixed intervals
+"""
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeDrivenScheduler:
+    """ Poll a cheap fingerprint of the inputs and run an update when it changes
+
+    get_fingerprint: callable
+        Returns a hashable fingerprint of the inputs (e.g. ETags of the files on s3).
+    run_update: callable
+        The update to run.
+    poll_interval: float
+        Seconds between two polls of the fingerprint.
+    debounce: float
+        An update only starts after the fingerprint has not changed for this many seconds,
+        so that inputs being written in several steps trigger only one update.
+    deadline: float
+        Stop polling after this many seconds.
+    min_time_for_update: float
+        An update only starts if this many seconds are left before the deadline (or as long as
+        the longest update so far, if longer), so that no update runs past the deadline.
+    run_on_start: bool
+        Whether to run an update right away (before any change).
+    """
+
+    def __init__(self,
+                 get_fingerprint,
+                 run_update,
+                 poll_interval: float = 60,
+                 debounce: float = 300,
+                 deadline: float = 10 * 3600,
+                 min_time_for_update: float = 3600,
+                 run_on_start: bool = True,
+                 clock=time.monotonic,
+                 sleep=time.sleep,
+                 ):
+        self.get_fingerprint = get_fingerprint
+        self.run_update = run_update
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.deadline = deadline
+        self.min_time_for_update = min_time_for_update
+        self.run_on_start = run_on_start
+        self.clock = clock
+        self.sleep = sleep
+        self.n_updates = 0
+        self.longest_update = 0
+
+    def _poll(self):
+        try:
+            return self.get_fingerprint()
+        except Exception as e:
+            logger.error(f'Error getting the fingerprint of the inputs: {e}')
+            return None
+
+    def _time_for_update(self) -> float:
+        return max(self.min_time_for_update, self.longest_update)
+
+    def _update(self, time_left: float):
+        """ Run an update, unless there is not enough time left before the deadline """
+        if time_left < self._time_for_update():
+            logger.warning(f'Update skipped: only {time_left:.0f} s left before the deadline')
+            return False
+        self.n_updates += 1
+        update_start = self.clock()
+        try:
+            self.run_update()
+        except Exception as e:
+            logger.error(e)
+        self.longest_update = max(self.longest_update, self.clock() - update_start)
+        return True
+
+    def run(self):
+        """ Poll and update until the deadline. Returns the number of updates """
+        start = self.clock()
+
+        def time_left():
+            return self.deadline - (self.clock() - start)
+
+        fingerprint_done = self._poll()  # Fingerprint of the inputs of the last update
+        if self.run_on_start:
+            self._update(time_left())
+
+        fingerprint_seen, changed_at = fingerprint_done, None
+        # Stop polling once an update could not start anymore after the next poll
+        while time_left() - self.poll_interval >= self._time_for_update():
+            self.sleep(self.poll_interval)
+
+            fingerprint = self._poll()
+            if fingerprint is None:
+                continue
+            if fingerprint != fingerprint_seen:
+                # A new change (re)starts the debounce window
+                logger.info('Change of the inputs detected')
+                fingerprint_seen, changed_at = fingerprint, self.clock()
+
+            if (changed_at is not None and fingerprint_seen != fingerprint_done
+                    and self.clock() - changed_at >= self.debounce
+                    and self._update(time_left())):
+                fingerprint_done, changed_at = fingerprint_seen, None
+
+        logger.info(f'Deadline reached after {self.n_updates} updates')
+        return self.n_updates
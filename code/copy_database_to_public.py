@@ -1,25 +1,12 @@
-import s3fs
-import os
-
-# Initialize the S3 filesystem
-fs = s3fs.S3FileSystem(anon=False)  # anon=False for authenticated access
+from aind_auto_train.util.aws_util import sync_dir_on_s3
 
 src_prefix = 'aind-behavior-data/foraging_auto_training/'
 dst_prefix = 'aind-behavior-data/foraging_nwb_bonsai_processed/foraging_auto_training/'
 
-def copy_folder_on_s3(src_prefix=src_prefix, dst_prefix=dst_prefix):
-    # Get a clean list of *files only*
-    for src_path in fs.find(src_prefix):
-        # 1. Skip placeholder “folders”
-        if src_path.endswith('/'):
-            continue
-
-        rel_path = os.path.relpath(src_path, src_prefix)
-
-        # 2. Skip the prefix itself (“.”) in case it sneaks in
-        if rel_path in ('.', ''):
-            continue
+def copy_folder_on_s3(src_prefix=src_prefix, dst_prefix=dst_prefix, max_workers=16):
+    """ Mirror {src_prefix} to {dst_prefix}, copying only new or changed objects
 
-        dst_path = f"{dst_prefix.rstrip('/')}/{rel_path}"
-        # Fast, server-side copy
-        fs.copy(src_path, dst_path)     # or fs.copy_file() in newer fsspec
+    The copies are server-side and run in {max_workers} threads.
+    Returns the copy report (see aind_auto_train.util.aws_util.sync_dir_on_s3)
+    """
+    return sync_dir_on_s3(src_prefix, dst_prefix, max_workers=max_workers)
@@ -1,34 +1,47 @@
 """ top level run script """
-import threading
-import time
 import logging
 
 from aind_auto_train import setup_logging, __version__
 from aind_auto_train.auto_train_manager import DynamicForagingAutoTrainManager
 from aind_auto_train.curriculum_manager import CurriculumManager, LOCAL_SAVED_CURRICULUM_ROOT
+from aind_auto_train.util.aws_util import get_s3_fingerprint
+from aind_auto_train.util.pipeline import update_managers
+from aind_auto_train.util.scheduler import ChangeDrivenScheduler
 from copy_database_to_public import copy_folder_on_s3
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
-def update_auto_train_database(managers, curriculum_manager, interval=3600):
+def update_auto_train_database(managers, curriculum_manager,
+                               poll_interval=60, debounce=300, deadline=10 * 3600):
     # Jon helped me trigger this capsule 10 PM each day by airflow.
     # So now there is no need to keep this capsule running.
     # But since the processing pipeline takes some time, we should run this one longer.
-    # Starting from 10 PM, let's update the curriculum manager once per 60 min for 10 times (until 7 AM in the morning)
+    # Starting from 10 PM, keep watching the behavior tables and the curriculums for 10 hours
+    # (until 8 AM in the morning), and update as soon as any of them has changed.
 
-    RUN_TIMES = 10  # Max pipeline run time for each run
-    for i in range(RUN_TIMES):
+    def run_update():
         logger.info(f'\n\n --- v{__version__} ---')
-        try:
-            logger.info(f'-- Update curriculums --')
-            curriculum_manager.download_curriculums()
-            logger.info(f'-- Update training manager --')
-            for manager_name, manager in managers.items():
-                manager.update()
-        except Exception as e:
-             logger.error(e)
-        time.sleep(interval)
+        logger.info(f'-- Update curriculums --')
+        curriculum_manager.download_curriculums()
+        logger.info(f'-- Update training manager --')
+        # Overlap the downloads / uploads of one manager with the evaluation of another
+        update_managers(managers)
+
+    # Only ETags are polled, which is cheap
+    watched_s3_paths = [
+        *[f"{manager.df_behavior_on_s3['bucket']}/{manager.df_behavior_on_s3['root']}"
+          f"{manager.df_behavior_on_s3['file_name']}" for manager in managers.values()],
+        f"{curriculum_manager.saved_curriculums_on_s3['bucket']}/"
+        f"{curriculum_manager.saved_curriculums_on_s3['root']}",
+    ]
+
+    ChangeDrivenScheduler(get_fingerprint=lambda: get_s3_fingerprint(watched_s3_paths),
+                          run_update=run_update,
+                          poll_interval=poll_interval,
+                          debounce=debounce,
+                          deadline=deadline,
+                          ).run()
 
 def run():
     # Connect to databases
@@ -49,7 +62,7 @@ def run():
         saved_curriculums_local=LOCAL_SAVED_CURRICULUM_ROOT
     )
 
-    # create a thread, and run update_auto_train_database() per 1 hour
+    # Run update_auto_train_database() whenever the behavior table or the curriculums change
     update_auto_train_database(managers, curriculum_manager)
 
 
@@ -0,0 +1,93 @@
+"""
+Directory transfers of aind_auto_train.util.aws_util, against a local filesystem standing in for S3
+"""
+import os
+
+import fsspec
+import pytest
+
+from aind_auto_train.util import aws_util
+
+
+@pytest.fixture
+def local_s3(tmp_path):
+    """ Use a local folder as the bucket """
+    aws_util.set_fs(fsspec.filesystem('file', auto_mkdir=True))
+    yield str(tmp_path / 'bucket')
+    aws_util.set_fs(None)
+
+
+def _make_dir(path, files: dict):
+    for rel_path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(path, rel_path)), exist_ok=True)
+        with open(os.path.join(path, rel_path), 'w') as f:
+            f.write(content)
+
+
+def _read_dir(path) -> dict:
+    files = {}
+    for root, _, file_names in os.walk(path):
+        for file_name in file_names:
+            with open(os.path.join(root, file_name)) as f:
+                files[os.path.relpath(os.path.join(root, file_name), path)] = f.read()
+    return files
+
+
+FILES = {'a.json': 'aa', 'b.svg': 'bbb', os.path.join('sub', 'c.json'): 'c'}
+
+
+def test_upload_and_download_dir(local_s3, tmp_path):
+    _make_dir(tmp_path / 'src', FILES)
+
+    summary = aws_util.upload_dir_to_s3(local_dir=str(tmp_path / 'src'),
+                                        bucket=local_s3, s3_dir='dir/', max_workers=2)
+    assert summary['objects'] == 3
+    assert summary['bytes'] == 6
+    assert summary['failed'] == []
+
+    summary = aws_util.download_dir_from_s3(bucket=local_s3, s3_dir='dir/',
+                                            local_dir=str(tmp_path / 'dst'), max_workers=2)
+    assert summary['objects'] == 3
+    assert _read_dir(tmp_path / 'dst') == FILES
+
+
+def test_upload_dir_include_exclude(local_s3, tmp_path):
+    _make_dir(tmp_path / 'src', {**FILES, 'a.snapshot.pkl': 'x', 'bundle.zip.tmp': 'x'})
+
+    aws_util.upload_dir_to_s3(local_dir=str(tmp_path / 'src'), bucket=local_s3, s3_dir='dir/',
+                              exclude=['*.tmp', '*.snapshot.pkl'])
+    assert _read_dir(os.path.join(local_s3, 'dir')) == FILES
+
+    aws_util.upload_dir_to_s3(local_dir=str(tmp_path / 'src'), bucket=local_s3, s3_dir='json/',
+                              include=['*.json'])
+    assert sorted(_read_dir(os.path.join(local_s3, 'json'))) == ['a.json', os.path.join('sub', 'c.json')]
+
+
+def test_sync_dir_from_s3_only_downloads_changes(local_s3, tmp_path):
+    _make_dir(os.path.join(local_s3, 'dir'), FILES)
+    local_dir = str(tmp_path / 'dst') + '/'
+
+    assert len(aws_util.sync_dir_from_s3(bucket=local_s3, s3_dir='dir/', local_dir=local_dir)) == 3
+    assert aws_util.sync_dir_from_s3(bucket=local_s3, s3_dir='dir/', local_dir=local_dir) == []
+
+    _make_dir(os.path.join(local_s3, 'dir'), {'b.svg': 'changed', 'd.pkl': 'new'})
+    downloaded = aws_util.sync_dir_from_s3(bucket=local_s3, s3_dir='dir/', local_dir=local_dir,
+                                           exclude=['*.pkl'])
+    assert downloaded == ['b.svg']
+    assert _read_dir(local_dir) == {**FILES, 'b.svg': 'changed'}
+
+
+def test_transfer_files_isolates_failures():
+    transferred = []
+
+    def transfer(src, dst):
+        if src == 'bad':
+            raise ValueError('not an OSError')
+        transferred.append(src)
+
+    summary = aws_util._transfer_files([('good', 'x', 1), ('bad', 'y', 2), ('also good', 'z', 3)],
+                                       transfer, max_workers=2)
+    assert sorted(transferred) == ['also good', 'good']
+    assert summary['failed'] == ['bad']
+    assert summary['objects'] == 2
+    assert summary['bytes'] == 4
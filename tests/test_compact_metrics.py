@@ -0,0 +1,86 @@
+"""
+Compact metrics of df_manager are rebuilt to the same metrics as stored in full mode,
+against a local filesystem standing in for S3
+"""
+import os
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pytest
+
+import aind_auto_train.auto_train_manager as auto_train_manager
+from aind_auto_train.auto_train_manager import DynamicForagingAutoTrainManager
+from aind_auto_train.curriculum_manager import CurriculumManager
+from aind_auto_train.util import aws_util
+from aind_auto_train.util.aws_util import export_df_to_s3
+
+# upload_to_database() always writes to this bucket
+BUCKET = 'aind-behavior-data'
+CURRICULUMS_ON_S3 = dict(bucket=BUCKET, root='saved_curriculums/')
+CURRICULUM_JSON = os.path.join(os.path.dirname(__file__), '..', 'code', 'aind_auto_train',
+                               'curriculums', 'Uncoupled Baiting_curriculum_v1.0_schema_v1.0.json')
+
+
+@pytest.fixture
+def local_s3(tmp_path, monkeypatch):
+    """ Use {tmp_path} as the root of the buckets, with one curriculum uploaded """
+    monkeypatch.chdir(tmp_path)
+    aws_util.set_fs(fsspec.filesystem('file', auto_mkdir=True))
+    os.makedirs(f'{BUCKET}/saved_curriculums')
+    with open(CURRICULUM_JSON, 'rb') as src, \
+            open(os.path.join(f'{BUCKET}/saved_curriculums', os.path.basename(CURRICULUM_JSON)), 'wb') as dst:
+        dst.write(src.read())
+    monkeypatch.setattr(auto_train_manager, 'CurriculumManager', lambda: CurriculumManager(
+        saved_curriculums_on_s3=CURRICULUMS_ON_S3,
+        saved_curriculums_local=str(tmp_path / 'curriculums') + '/',
+        snapshot_dir=str(tmp_path / 'snapshots')))
+    yield tmp_path
+    aws_util.set_fs(None)
+
+
+def _make_df_behavior(n_subjects=6, n_sessions=12, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame([dict(subject_id=str(700000 + subject), session=float(session),
+                              session_date=pd.Timestamp('2024-01-01') + pd.Timedelta(days=session),
+                              task='Uncoupled Baiting', curriculum_name='Uncoupled Baiting',
+                              curriculum_version='1.0', curriculum_schema_version='1.0',
+                              current_stage_actual='STAGE_1',
+                              foraging_eff=float(rng.uniform(0.5, 0.9)),
+                              finished_trials=int(rng.integers(100, 700)))
+                         for subject in range(n_subjects) for session in range(1, n_sessions + 1)])
+
+
+def _replay(df_behaviors: list, root: str, if_compact_metrics: bool) -> DynamicForagingAutoTrainManager:
+    """ Restart a manager on each of {df_behaviors} in turn and update it """
+    for df_behavior in df_behaviors:
+        export_df_to_s3(df_behavior, 'df_sessions.pkl', bucket=BUCKET, s3_path=root)
+        manager = DynamicForagingAutoTrainManager(
+            manager_name='test',
+            df_behavior_on_s3=dict(bucket=BUCKET, root=root, file_name='df_sessions.pkl'),
+            df_manager_root_on_s3=dict(bucket=BUCKET, root=root),
+            if_compact_metrics=if_compact_metrics)
+        manager.update()
+    return manager
+
+
+@pytest.mark.parametrize('change', ['late_sessions', 'corrected_upstream'])
+def test_compact_metrics_match_full_metrics(local_s3, change):
+    df_full = _make_df_behavior()
+    if change == 'late_sessions':
+        # Some middle sessions only arrive in the second download
+        df_behaviors = [df_full[df_full.index % 5 != 2], df_full]
+    else:
+        # Older sessions are corrected upstream in the second download
+        df_corrected = df_full.copy()
+        df_corrected.loc[df_corrected.index[::3], 'foraging_eff'] += 0.01
+        df_behaviors = [df_full[df_full.session <= 8], df_corrected]
+
+    full = _replay(df_behaviors, 'full/', if_compact_metrics=False).df_manager
+    compact = _replay(df_behaviors, 'compact/', if_compact_metrics=True)
+
+    assert all('n_arrived' in metrics for metrics in compact.df_manager['metrics'])
+    rebuilt = compact.get_full_metrics()
+    assert len(rebuilt) == len(full)
+    for expected, actual in zip(full['metrics'], rebuilt):
+        assert actual == expected
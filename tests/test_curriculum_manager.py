@@ -0,0 +1,49 @@
+"""
+Curriculum upload and download through the bundle, against a local filesystem standing in for S3
+"""
+import os
+import shutil
+
+import fsspec
+import pytest
+
+from aind_auto_train.curriculum_manager import CurriculumManager
+from aind_auto_train.util import aws_util
+
+CURRICULUM_JSON = os.path.join(os.path.dirname(__file__), '..', 'code', 'aind_auto_train',
+                               'curriculums', 'Uncoupled Baiting_curriculum_v1.0_schema_v1.0.json')
+
+
+@pytest.fixture
+def s3_root(tmp_path):
+    aws_util.set_fs(fsspec.filesystem('file', auto_mkdir=True))
+    yield dict(bucket=str(tmp_path / 'bucket'), root='saved_curriculums/')
+    aws_util.set_fs(None)
+
+
+def _manager(s3_root, tmp_path, name, **kwargs):
+    return CurriculumManager(saved_curriculums_on_s3=s3_root,
+                             saved_curriculums_local=str(tmp_path / name) + '/',
+                             snapshot_dir=str(tmp_path / 'snapshots'),
+                             **kwargs)
+
+
+def test_bundle_worker_upload_keeps_published_curriculums(s3_root, tmp_path):
+    os.makedirs(tmp_path / 'author')
+    shutil.copy(CURRICULUM_JSON, tmp_path / 'author')
+    _manager(s3_root, tmp_path, 'author').upload_curriculums()
+
+    # A worker reading the bundle uploads without having any curriculum json locally
+    _manager(s3_root, tmp_path, 'worker', use_bundle=True).upload_curriculums()
+
+    reader = _manager(s3_root, tmp_path, 'reader', use_bundle=True)
+    df_curriculums = reader.df_curriculums()
+    assert len(df_curriculums) == 1
+    assert reader.get_curriculum(curriculum_name='Uncoupled Baiting',
+                                 curriculum_schema_version='1.0',
+                                 curriculum_version='1.0') is not None
+
+
+def test_no_upload_without_curriculums(s3_root, tmp_path):
+    _manager(s3_root, tmp_path, 'worker', use_bundle=True).upload_curriculums()
+    assert not os.path.exists(os.path.join(s3_root['bucket'], s3_root['root']))
@@ -0,0 +1,32 @@
+"""
+Manifest of the saved curriculum json files
+"""
+import json
+import os
+
+from aind_auto_train.util.curriculum_util import sync_manifest
+
+JSON_NAME = 'Task_curriculum_v1.0_schema_v1.0.json'
+
+
+def _write_curriculum(path, description):
+    with open(path, 'w') as f:
+        json.dump(dict(curriculum_description=description), f)
+
+
+def test_sync_manifest_rereads_edits_of_the_same_size(tmp_path):
+    json_file = str(tmp_path / JSON_NAME)
+    _write_curriculum(json_file, 'first')
+    entry = sync_manifest(str(tmp_path), [json_file])[JSON_NAME]
+    assert entry['curriculum_description'] == 'first'
+
+    # Same length, and a later modification time even on filesystems with a coarse clock
+    _write_curriculum(json_file, 'other')
+    os.utime(json_file, ns=(entry['mtime_ns'] + 10 ** 9, entry['mtime_ns'] + 10 ** 9))
+    edited = sync_manifest(str(tmp_path), [json_file])[JSON_NAME]
+    assert edited['size'] == entry['size']
+    assert edited['curriculum_description'] == 'other'
+    assert edited['md5'] != entry['md5']
+
+    # Unchanged files are not read again
+    assert sync_manifest(str(tmp_path), [json_file])[JSON_NAME] == edited
@@ -0,0 +1,38 @@
+"""
+Importing the updater and the curriculum schema must not load the plotting libraries
+"""
+import json
+import subprocess
+import sys
+
+PLOTTING_MODULES = ['matplotlib', 'plotly', 'graphviz']
+
+# Generous bound on the import time, to catch heavy imports coming back at module level
+IMPORT_TIME_BUDGET = 5.0  # seconds
+
+
+def _import_in_subprocess(module: str) -> dict:
+    """ Import {module} in a fresh interpreter and return the import time and loaded plotting modules """
+    code = f"""
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps(dict(
+    import_time=time.perf_counter() - start,
+    loaded=[name for name in {PLOTTING_MODULES!r} if name in sys.modules])))
+"""
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_auto_train_manager_import():
+    result = _import_in_subprocess('aind_auto_train.auto_train_manager')
+    assert result['loaded'] == []
+    assert result['import_time'] < IMPORT_TIME_BUDGET
+
+
+def test_curriculum_schema_import():
+    result = _import_in_subprocess('aind_auto_train.schema.curriculum')
+    assert result['loaded'] == []
+    assert result['import_time'] < IMPORT_TIME_BUDGET
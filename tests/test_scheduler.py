@@ -0,0 +1,76 @@
+"""
+ChangeDrivenScheduler on a simulated clock
+"""
+from aind_auto_train.util.scheduler import ChangeDrivenScheduler
+
+
+class SimulatedInputs:
+    """ Inputs whose fingerprint changes at given times, and updates that take {update_duration} """
+
+    def __init__(self, changes: dict, update_duration: float = 0):
+        self.now = 0.0
+        self.changes = changes  # {time: fingerprint}
+        self.update_duration = update_duration
+        self.updates = []  # (start, end, fingerprint) of each update
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def get_fingerprint(self):
+        return [fingerprint for time, fingerprint in sorted(self.changes.items()) if time <= self.now][-1]
+
+    def run_update(self):
+        start, fingerprint = self.now, self.get_fingerprint()
+        self.now += self.update_duration
+        self.updates.append((start, self.now, fingerprint))
+
+    def scheduler(self, **kwargs):
+        return ChangeDrivenScheduler(get_fingerprint=self.get_fingerprint, run_update=self.run_update,
+                                     clock=self.clock, sleep=self.sleep, **kwargs)
+
+
+SCHEDULE = dict(poll_interval=60, debounce=300, deadline=10 * 3600, min_time_for_update=600)
+
+
+def test_update_after_debounce():
+    inputs = SimulatedInputs({0: 'a', 1000: 'b'})
+    assert inputs.scheduler(**SCHEDULE).run() == 2
+    assert inputs.updates[0] == (0, 0, 'a')  # run_on_start
+    start, _, fingerprint = inputs.updates[1]
+    assert fingerprint == 'b'
+    assert 1000 + 300 <= start < 1000 + 300 + 2 * 60
+
+
+def test_burst_of_changes_is_one_update():
+    inputs = SimulatedInputs({0: 'a', 1000: 'b', 1100: 'c', 1250: 'd', 1400: 'e'})
+    assert inputs.scheduler(run_on_start=False, **SCHEDULE).run() == 1
+    start, _, fingerprint = inputs.updates[0]
+    assert fingerprint == 'e'
+    assert start >= 1400 + 300
+
+
+def test_revert_to_previous_fingerprint_is_not_an_update():
+    inputs = SimulatedInputs({0: 'a', 1000: 'b', 1100: 'a'})
+    assert inputs.scheduler(**SCHEDULE).run() == 1
+    assert [fingerprint for _, _, fingerprint in inputs.updates] == ['a']
+
+
+def test_updates_do_not_run_past_the_deadline():
+    # The change would start a 3600 s update at t=960 of a 1000 s deadline
+    inputs = SimulatedInputs({0: 'a', 600: 'b'}, update_duration=3600)
+    assert inputs.scheduler(poll_interval=60, debounce=300, deadline=1000, run_on_start=False,
+                            min_time_for_update=0).run() == 1
+    assert inputs.updates[0][1] > 1000
+
+    inputs = SimulatedInputs({0: 'a', 600: 'b'}, update_duration=3600)
+    assert inputs.scheduler(poll_interval=60, debounce=300, deadline=1000, run_on_start=False).run() == 0
+    assert inputs.now <= 1000
+
+    # After the first update, no update starts with less time left than the longest update so far
+    inputs = SimulatedInputs({0: 'a', 1000: 'b', 20000: 'c'}, update_duration=3600)
+    inputs.scheduler(poll_interval=60, debounce=300, deadline=22000, min_time_for_update=600).run()
+    assert [fingerprint for _, _, fingerprint in inputs.updates] == ['a', 'b']
+    assert all(end <= 22000 for _, end, _ in inputs.updates)
@@ -0,0 +1,41 @@
+"""
+Pre-validated snapshots of the curriculums are invalidated when the schema changes
+"""
+import os
+
+import aind_data_schema
+import pytest
+
+from aind_auto_train.schema import curriculum as curriculum_schemas
+from aind_auto_train.schema.curriculum import DynamicForagingCurriculum
+
+CURRICULUM_JSON = os.path.join(os.path.dirname(__file__), '..', 'code', 'aind_auto_train',
+                               'curriculums', 'Uncoupled Baiting_curriculum_v1.0_schema_v1.0.json')
+
+
+@pytest.fixture
+def saved_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(curriculum_schemas, '_schema_fingerprints', {})
+    with open(CURRICULUM_JSON, 'rb') as f:
+        content = f.read()
+    curriculum = DynamicForagingCurriculum.model_validate_json(content)
+    curriculum_schemas.save_snapshot(curriculum, CURRICULUM_JSON, content, str(tmp_path))
+    return content
+
+
+def test_snapshot_is_loaded_if_up_to_date(saved_snapshot, tmp_path):
+    curriculum = curriculum_schemas.load_snapshot(CURRICULUM_JSON, saved_snapshot, str(tmp_path))
+    assert isinstance(curriculum, DynamicForagingCurriculum)
+    assert curriculum_schemas.load_snapshot(CURRICULUM_JSON, saved_snapshot + b' ', str(tmp_path)) is None
+
+
+def test_snapshot_is_outdated_by_aind_data_schema(saved_snapshot, tmp_path, monkeypatch):
+    monkeypatch.setattr(curriculum_schemas, '_schema_fingerprints', {})
+    monkeypatch.setattr(aind_data_schema, '__version__', aind_data_schema.__version__ + '.post1')
+    assert curriculum_schemas.load_snapshot(CURRICULUM_JSON, saved_snapshot, str(tmp_path)) is None
+
+
+def test_snapshot_is_outdated_by_model_config(saved_snapshot, tmp_path, monkeypatch):
+    monkeypatch.setattr(curriculum_schemas, '_schema_fingerprints', {})
+    monkeypatch.setitem(aind_data_schema.base.AindModel.model_config, 'extra', 'allow')
+    assert curriculum_schemas.load_snapshot(CURRICULUM_JSON, saved_snapshot, str(tmp_path)) is None
@@ -0,0 +1,34 @@
+"""
+Compiled conditions of the transition rules
+"""
+import pytest
+
+from aind_auto_train.schema.curriculum import Decision, TransitionRule
+from aind_auto_train.schema.task import TrainingStage
+
+
+def _rule(condition: str) -> TransitionRule:
+    return TransitionRule(decision=Decision.PROGRESS, to_stage=TrainingStage.STAGE_2,
+                          condition=condition)
+
+
+def test_condition_follows_copies_and_assignments():
+    rule = _rule("lambda metrics: metrics > 1")
+    assert rule.condition_func()(2)
+
+    copied = rule.model_copy(update={'condition': "lambda metrics: metrics > 3"})
+    assert not copied.condition_func()(2)
+    assert rule.condition_func()(2)
+
+    rule.condition = "lambda metrics: metrics < 0"
+    assert not rule.condition_func()(2)
+
+
+def test_invalid_condition_raises_only_when_evaluated():
+    rule = _rule("undefined_name")
+    with pytest.raises(NameError):
+        rule.condition_func()
+
+    rule = _rule("lambda metrics: (")
+    with pytest.raises(SyntaxError):
+        rule.condition_func()